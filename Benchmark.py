@@ -0,0 +1,216 @@
+from NewECDSA import ECDSA, EllipticCurve
+from MHKS import MerkleHellmanKnapsack
+from Rabbit import Rabbit
+import Main
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+# Benchmarks for Rabbit, ECDSA, MHKS and the whole transfer of Main.
+#
+#   python Benchmark.py --output results.json
+#   python Benchmark.py --baseline results.json --threshold 0.15
+#
+# Every result is a rate (MB/s or ops/s, higher is better). With
+# --baseline the run fails (exit code 1) when a result is more than
+# threshold slower than the same result in the baseline file.
+
+KEY = int(Main.Rabbit_key, 16)
+
+DEFAULT_SIZES = '1K,64K,1M'
+DEFAULT_TRANSFER_SIZES = '1K,1M,16M'
+FULL_TRANSFER_SIZES = '1K,1M,16M,128M,1G'
+
+UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_size(text):
+    '''"64K" -> 65536'''
+    text = text.strip().upper()
+    if text and text[-1] in UNITS:
+        return int(text[:-1]) * UNITS[text[-1]]
+    return int(text)
+
+
+def format_size(size):
+    for suffix in ('G', 'M', 'K'):
+        if size >= UNITS[suffix] and size % UNITS[suffix] == 0:
+            return '%d%s' % (size // UNITS[suffix], suffix)
+    return str(size)
+
+
+def best_time(func, repeat):
+    '''Shortest of repeat runs of func(), in seconds'''
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def result(name, unit, value):
+    return {'name': name, 'unit': unit, 'value': value}
+
+
+def bench_rabbit(sizes, repeat):
+    results = []
+    for size in sizes:
+        data = os.urandom(size)
+        label = format_size(size)
+        mb = size / (1 << 20)
+        t = best_time(lambda: Rabbit(KEY, 0).keystream_bytes(size), repeat)
+        results.append(result('rabbit.keystream_bytes.%s' % label, 'MB/s', mb / t))
+        t = best_time(lambda: Rabbit(KEY, 0).encrypt_bytes(data), repeat)
+        results.append(result('rabbit.encrypt_bytes.%s' % label, 'MB/s', mb / t))
+        # the str API is much slower, keep it to the small sizes
+        if size <= (1 << 16):
+            text = data.decode('latin-1')
+            t = best_time(lambda: Rabbit(KEY, 0).encrypt(text), repeat)
+            results.append(result('rabbit.encrypt.%s' % label, 'MB/s', mb / t))
+    return results
+
+
+def bench_ecdsa(count, repeat):
+    curve = EllipticCurve()
+    ecdsa = ECDSA(curve)
+    G = curve.generator()
+    curve.generator_table() # built once, not part of the measurement
+    scalars = [random.randrange(1, curve.order) for i in range(count)]
+    private_key, public_key = ecdsa.generate_key_pair()
+    messages = ['message %d' % i for i in range(count)]
+    signatures = [ecdsa.sign(private_key, m) for m in messages]
+
+    results = []
+    def rate(name, func):
+        results.append(result(name, 'ops/s', count / best_time(func, repeat)))
+    rate('ecdsa.multiply', lambda: [curve.multiply(G, k) for k in scalars])
+    rate('ecdsa.multiply_jacobian', lambda: [curve.multiply_jacobian(G, k) for k in scalars])
+    rate('ecdsa.multiply_glv', lambda: [curve.multiply_glv(G, k) for k in scalars])
+    rate('ecdsa.multiply_generator', lambda: [curve.multiply_generator(k) for k in scalars])
+    rate('ecdsa.generate_key_pair', lambda: [ecdsa.generate_key_pair() for k in scalars])
+    rate('ecdsa.sign', lambda: [ecdsa.sign(private_key, m) for m in messages])
+    rate('ecdsa.verify', lambda: [ecdsa.verify(public_key, m, s) for m, s in zip(messages, signatures)])
+    items = [(public_key, m, s) for m, s in zip(messages, signatures)]
+    rate('ecdsa.verify_batch', lambda: ecdsa.verify_batch(items))
+    return results
+
+
+def bench_mhks(count, repeat):
+    mhks = MerkleHellmanKnapsack()
+    mhks.private_key # generate the keys outside of the measurements
+    blocks = [random.getrandbits(128) for i in range(count)]
+    ciphertexts = mhks.encrypt_many(blocks, mhks.public_key)
+
+    results = []
+    def rate(name, func, n = count):
+        results.append(result(name, 'ops/s', n / best_time(func, repeat)))
+    keygen = max(1, count // 10)
+    rate('mhks.generate_keypair', lambda: [mhks.generate_keypair() for i in range(keygen)], keygen)
+    rate('mhks.encrypt', lambda: [mhks.encrypt(b, mhks.public_key) for b in blocks])
+    rate('mhks.encrypt_many', lambda: mhks.encrypt_many(blocks, mhks.public_key))
+    rate('mhks.decrypt', lambda: [mhks.decrypt(c, mhks.private_key) for c in ciphertexts])
+    rate('mhks.decrypt_many', lambda: mhks.decrypt_many(ciphertexts, mhks.private_key))
+    return results
+
+
+def bench_transfer(sizes, repeat):
+    '''The whole streamed exchange of Main (keys, encryption, key wrapping,
+    signature, decryption and verification) for files of every size'''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'file.bin')
+        encrypted = os.path.join(directory, 'file.enc')
+        output = os.path.join(directory, 'output.bin')
+        for size in sizes:
+            with open(source, 'wb') as file:
+                remaining = size
+                while remaining:
+                    chunk = min(remaining, 1 << 20)
+                    file.write(os.urandom(chunk))
+                    remaining -= chunk
+            def transfer():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    Main.main_stream(source, encrypted, output)
+            t = best_time(transfer, repeat)
+            results.append(result('transfer.main_stream.%s' % format_size(size), 'MB/s', size / (1 << 20) / t))
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Returns the list of regressions, as (name, baseline value, value)'''
+    old = {r['name']: r['value'] for r in baseline['results']}
+    regressions = []
+    for r in results:
+        if r['name'] in old and r['value'] < old[r['name']] * (1 - threshold):
+            regressions.append((r['name'], old[r['name']], r['value']))
+    return regressions
+
+
+def run(args):
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    transfer_sizes = [parse_size(s) for s in args.transfer_sizes.split(',')] if args.transfer_sizes else []
+    groups = set(args.only.split(',')) if args.only else {'rabbit', 'ecdsa', 'mhks', 'transfer'}
+
+    results = []
+    if 'rabbit' in groups:
+        results += bench_rabbit(sizes, args.repeat)
+    if 'ecdsa' in groups:
+        results += bench_ecdsa(args.count, args.repeat)
+    if 'mhks' in groups:
+        results += bench_mhks(args.count, args.repeat)
+    if 'transfer' in groups:
+        results += bench_transfer(transfer_sizes, args.repeat)
+
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmarks for Rabbit, ECDSA, MHKS and the transfer of Main')
+    parser.add_argument('--sizes', default = DEFAULT_SIZES, help = 'Rabbit message sizes (default %(default)s)')
+    parser.add_argument('--transfer-sizes', default = DEFAULT_TRANSFER_SIZES, help = 'file sizes of the end to end transfer (default %(default)s)')
+    parser.add_argument('--full', action = 'store_true', help = 'end to end transfer from 1K up to 1G')
+    parser.add_argument('--count', type = int, default = 100, help = 'operations per ECDSA/MHKS measurement')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per measurement, the best one is kept')
+    parser.add_argument('--only', help = 'comma separated groups: rabbit,ecdsa,mhks,transfer')
+    parser.add_argument('--output', help = 'write the results as JSON to this file')
+    parser.add_argument('--baseline', help = 'JSON results to compare with')
+    parser.add_argument('--threshold', type = float, default = 0.10, help = 'allowed slowdown against the baseline (default %(default)s)')
+    args = parser.parse_args(argv)
+    if args.full:
+        args.transfer_sizes = FULL_TRANSFER_SIZES
+
+    report = run(args)
+    text = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(report['results'], baseline, args.threshold)
+        for name, old, new in regressions:
+            print('REGRESSION %s: %.4g -> %.4g (%.1f%%)' % (name, old, new, (new / old - 1) * 100), file = sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
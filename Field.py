@@ -0,0 +1,50 @@
+import os
+
+# Big integer backend of EllipticCurve, chosen at import:
+#
+#   gmpy2  : GMP integers (mpz), used when gmpy2 is installed
+#   python : plain Python ints, always available
+#
+# Set CRYPTO_BIGINT_BACKEND=python to force the pure Python backend (or
+# =gmpy2 to fail loudly when it is missing).
+#
+# The curve code reduces with "% field.p" inline: with p an mpz every
+# intermediate value then stays an mpz, and a method call per operation
+# would cost more than the operation itself in CPython.
+
+_requested = os.environ.get('CRYPTO_BIGINT_BACKEND', '').lower()
+
+if _requested == 'python':
+    gmpy2 = None
+else:
+    try:
+        import gmpy2
+    except ImportError:
+        if _requested == 'gmpy2':
+            raise
+        gmpy2 = None
+
+if gmpy2 is not None:
+    BACKEND = 'gmpy2'
+    mpz = gmpy2.mpz
+
+    def inverse(a, m):
+        '''a^-1 mod m, ZeroDivisionError when a has no inverse'''
+        return gmpy2.invert(a, m)
+else:
+    BACKEND = 'python'
+    mpz = int
+
+    def inverse(a, m):
+        '''a^-1 mod m, ZeroDivisionError when a has no inverse'''
+        try:
+            return pow(a, -1, m)
+        except ValueError:
+            raise ZeroDivisionError("%d has no inverse modulo %d" % (a, m))
+
+
+class PrimeField:
+    '''Integers modulo a prime p'''
+
+    def __init__(self, p):
+        self.p = mpz(p) # as a backend integer
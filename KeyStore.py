@@ -0,0 +1,83 @@
+from MHKS import MerkleHellmanKnapsack
+
+import json
+import os
+import tempfile
+
+# On-disk store for the keys of every Person, so a restart reuses them.
+# Only the private parts are saved, the public keys are derived again
+# when loading (MHKS: r * element mod q, ECDSA: private_key * G).
+# Numbers are written as hex strings:
+#
+# {"version": 1,
+#  "people": {"bob": {"mhks": {"private_key": [...], "q": "...", "r": "..."},
+#                     "ecdsa": {"private_key": "..."}}}}
+
+VERSION = 1
+
+
+class KeyStore:
+    def __init__(self, path):
+        self.path = path
+        self._data = None # loaded on first use
+
+    def _load(self):
+        if self._data is None:
+            if os.path.exists(self.path):
+                with open(self.path) as file:
+                    data = json.load(file)
+                if data.get('version') != VERSION:
+                    raise ValueError("unsupported key store version %r" % data.get('version'))
+                self._data = data
+            else:
+                self._data = {'version': VERSION, 'people': {}}
+        return self._data
+
+    def _save(self):
+        # the file holds private keys: written to a temporary file only
+        # readable by the owner (mkstemp creates it with mode 0600), then
+        # moved over the old one. The name is unique so processes sharing
+        # the store do not write to the same temporary file.
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(self.path)),
+                                   prefix = os.path.basename(self.path) + '.', suffix = '.tmp')
+        try:
+            os.chmod(tmp, 0o600)
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self._data, file, separators = (',', ':'))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _person(self, name):
+        return self._load()['people'].setdefault(name, {})
+
+    def load_mhks(self, name):
+        '''Returns a MerkleHellmanKnapsack with the saved keys of name, or None'''
+        entry = self._load()['people'].get(name, {}).get('mhks')
+        if entry is None:
+            return None
+        private_key = [int(element, 16) for element in entry['private_key']]
+        q = int(entry['q'], 16)
+        r = int(entry['r'], 16)
+        public_key = [(r * element) % q for element in private_key]
+        return MerkleHellmanKnapsack((private_key, public_key, q, r))
+
+    def save_mhks(self, name, mhks):
+        self._person(name)['mhks'] = {
+            'private_key': ['%x' % element for element in mhks.private_key],
+            'q': '%x' % mhks.q,
+            'r': '%x' % mhks.r}
+        self._save()
+
+    def load_ecdsa(self, name, curve):
+        '''Returns the saved (private_key, public_key) of name, or None'''
+        entry = self._load()['people'].get(name, {}).get('ecdsa')
+        if entry is None:
+            return None
+        private_key = int(entry['private_key'], 16)
+        return private_key, curve.multiply_generator(private_key)
+
+    def save_ecdsa(self, name, private_key):
+        self._person(name)['ecdsa'] = {'private_key': '%x' % private_key}
+        self._save()
@@ -1,14 +1,68 @@
 import random
 import math
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+BLOCK_BITS = 128 # size of a plaintext block
+BLOCK_BYTES = BLOCK_BITS // 8
+TABLE_CACHE_SIZE = 16 # public keys whose subset-sum tables are kept
+
+_worker_key = None # (private_key, q, r_inverse) of a decrypt_many worker process
+
+def _init_decrypt_worker(private_key, q, r_inverse):
+    global _worker_key
+    _worker_key = (private_key, q, r_inverse)
+
+def _decrypt_chunk(ciphertexts):
+    private_key, q, r_inverse = _worker_key
+    return [_decrypt_block(c, private_key, q, r_inverse) for c in ciphertexts]
+
+def _decrypt_block(ciphertext, private_key, q, r_inverse):
+    s = ciphertext * r_inverse % q
+    #the private key is superincreasing so from the biggest element down, when the element
+    #is smaller or equal to s it must be in the sum. reversed index i is bit i of the result
+    value = 0
+    bit = 1
+    for element in reversed(private_key):
+        if element <= s:
+            value |= bit
+            s -= element
+        bit <<= 1
+    return value
 
 class MerkleHellmanKnapsack:
-    def __init__(self):
-        self.private_key, self.public_key, self.q, self.r = self.generate_keypair()
+    def __init__(self, keys = None):
+        #keys = (private_key, public_key, q, r) to use existing keys, otherwise a keypair
+        #is generated the first time one of the keys is needed, so encrypting with
+        #someone else's public key never generates a keypair
+        self._keys = None
+        if keys is not None:
+            self.set_keys(*keys)
+        self._tables = OrderedDict() # tuple(public key) -> subset-sum tables
+
+    def set_keys(self, private_key, public_key, q, r):
+        #the inverse of r mod q is needed by every decryption so we compute it once
+        self._keys = (private_key, public_key, q, r, pow(r, -1, q))
+
+    def _get_keys(self):
+        if self._keys is None:
+            self.set_keys(*self.generate_keypair())
+        return self._keys
+
+    has_keys = property(lambda self: self._keys is not None)
+    private_key = property(lambda self: self._get_keys()[0])
+    public_key = property(lambda self: self._get_keys()[1])
+    q = property(lambda self: self._get_keys()[2])
+    r = property(lambda self: self._get_keys()[3])
+    r_inverse = property(lambda self: self._get_keys()[4])
 
     def generate_superincreasing_sequence(self, length): #generaete superincreasing_sequence that will be my private key 
         sequence = [random.randint(1, 1000)]
+        total = sequence[0] #running sum of the sequence
         for _ in range(1, length):
-            sequence.append(random.randint(sum(sequence) + 1, 2 * sum(sequence))) #by the order of the seq we every time add next number that bigger than the sum of everyone before
+            element = random.randint(total + 1, 2 * total) #by the order of the seq we every time add next number that bigger than the sum of everyone before
+            sequence.append(element)
+            total += element
         return sequence
 
     def generate_keypair(self):
@@ -23,24 +77,100 @@ class MerkleHellmanKnapsack:
         return private_key, public_key, q, r
 
     def encrypt(self, plaintext, public_key): #we encrypt blocks of 128
-        binary_plaintext = bin(plaintext)[2:].zfill(128) #if the block smaller than 128 add 0 to the left
-        #multiple puclic key with plaintext and sum
-        encrypted = sum([int(bit) * element for bit, element in zip(binary_plaintext, public_key)])
+        #the most significant bit goes with public_key[0] so bit i goes with public_key[127 - i]
+        #we only walk on the bits that are set and sum their elements
+        if plaintext < 0 or plaintext >> BLOCK_BITS:
+            raise ValueError("plaintext must be a %d bit block" % BLOCK_BITS)
+        encrypted = 0
+        last = BLOCK_BITS - 1
+        while plaintext:
+            low = plaintext & -plaintext #lowest set bit
+            encrypted += public_key[last - (low.bit_length() - 1)]
+            plaintext ^= low
         return encrypted
 
+    def _subset_sum_tables(self, public_key):
+        #for every byte j of the block (0 = least significant) tables[j][v] is the sum
+        #of the elements of the bits set in v, so a block is 16 lookups instead of 128 bits
+        key = tuple(public_key)
+        tables = self._tables.get(key)
+        if tables is not None:
+            self._tables.move_to_end(key)
+            return tables
+        tables = []
+        last = BLOCK_BITS - 1
+        for j in range(BLOCK_BYTES):
+            elements = [public_key[last - (8 * j + bit)] for bit in range(8)]
+            table = [0] * 256
+            for v in range(1, 256):
+                low = v & -v
+                #v without its lowest bit was already computed
+                table[v] = table[v ^ low] + elements[low.bit_length() - 1]
+            tables.append(table)
+        self._tables[key] = tables
+        if len(self._tables) > TABLE_CACHE_SIZE:
+            self._tables.popitem(last = False)
+        return tables
+
+    def encrypt_many(self, plaintexts, public_key):
+        #encrypt many 128 bit blocks with the same public key
+        tables = self._subset_sum_tables(public_key)
+        result = []
+        for plaintext in plaintexts:
+            if plaintext < 0 or plaintext >> BLOCK_BITS:
+                raise ValueError("plaintext must be a %d bit block" % BLOCK_BITS)
+            encrypted = 0
+            for table in tables:
+                encrypted += table[plaintext & 0xFF]
+                plaintext >>= 8
+            result.append(encrypted)
+        return result
+
+    def encrypt_for_keys(self, plaintext, public_keys):
+        #encrypt one 128 bit block for many public keys (one per recipient),
+        #the set bits are found once and every key only sums its elements
+        if plaintext < 0 or plaintext >> BLOCK_BITS:
+            raise ValueError("plaintext must be a %d bit block" % BLOCK_BITS)
+        indexes = []
+        last = BLOCK_BITS - 1
+        while plaintext:
+            low = plaintext & -plaintext
+            indexes.append(last - (low.bit_length() - 1))
+            plaintext ^= low
+        return [sum([public_key[i] for i in indexes]) for public_key in public_keys]
+
+    def encrypt_bytes(self, payload, public_key):
+        #encrypt a payload of any length as a list of 128 bit blocks (big endian),
+        #the last block is padded with zero bytes so the length is needed to decrypt
+        payload = bytes(payload)
+        if len(payload) % BLOCK_BYTES:
+            payload += bytes(BLOCK_BYTES - len(payload) % BLOCK_BYTES)
+        blocks = [int.from_bytes(payload[i:i + BLOCK_BYTES], 'big') for i in range(0, len(payload), BLOCK_BYTES)]
+        return self.encrypt_many(blocks, public_key)
+
+    def decrypt_bytes(self, ciphertexts, private_key, length):
+        #inverse of encrypt_bytes, length is the size of the original payload
+        payload = b''.join(v.to_bytes(BLOCK_BYTES, 'big') for v in self.decrypt_many(ciphertexts, private_key))
+        return payload[:length]
+
     def decrypt(self, ciphertext, private_key):
-        decrypted = []
-        #pow(self.r, -1, self.q) this is the inverse of r and we * with cipher text modolo q
-        s = (ciphertext * pow(self.r, -1, self.q)) % self.q
-        #all the point of knapsack we run on our private_key that issuperincreasing seq so wen the element is smaller the s it must be him
-        for element in reversed(private_key):
-            if element <= s:
-                decrypted.insert(0, 1)
-                s -= element
-            else:
-                decrypted.insert(0, 0)
-        decrypted_value = int(''.join(str(bit) for bit in decrypted), 2)#convert to decimal
-        return decrypted_value
+        #self.r_inverse is the inverse of r and we * with cipher text modolo q
+        return _decrypt_block(ciphertext, private_key, self.q, self.r_inverse)
+
+    def decrypt_many(self, ciphertexts, private_key, workers = None):
+        #decrypt many blocks with the same private key, with workers > 1
+        #the blocks are split between processes
+        ciphertexts = list(ciphertexts)
+        if workers is None or workers <= 1 or len(ciphertexts) < 2:
+            return [_decrypt_block(c, private_key, self.q, self.r_inverse) for c in ciphertexts]
+        size = -(-len(ciphertexts) // (workers * 4)) #a few chunks per worker
+        chunks = [ciphertexts[i:i + size] for i in range(0, len(ciphertexts), size)]
+        result = []
+        with ProcessPoolExecutor(workers, initializer = _init_decrypt_worker,
+                                 initargs = (private_key, self.q, self.r_inverse)) as pool:
+            for values in pool.map(_decrypt_chunk, chunks):
+                result.extend(values)
+        return result
     
     def returnKeys(self):
         return self.private_key, self.public_key, self.q, self.r
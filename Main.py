@@ -1,29 +1,62 @@
 from NewECDSA import ECDSA,EllipticCurve
 from MHKS import MerkleHellmanKnapsack
 from Rabbit import Rabbit
+import Rabbit as RabbitCipher
+from KeyStore import KeyStore
+import Metrics
+import Pipeline
+import WireFormat
 
 # import that used for converting binary data to ASCII
 # encoded hexadecimal strings
 import binascii
+import argparse
+import json
+import mmap
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Rabbit key
 Rabbit_key = '0f01dbd6d2ea452fb64730c544269f44'
 
+# size of the blocks read by the streaming mode
+CHUNK_SIZE = 1 << 20
+
 class Person:
-    def __init__(self):
+    def __init__(self, name = None, store = None):
+        # with a name and a KeyStore the keys are loaded from the store
+        # and only generated (and saved) the first time
+        self.name = name
+        self.store = store
         self.isMessageWaiting = False
         self.messageWaiting = None
         self.signedMessageWaiting = None
 
     def GenerateMHKSKeys(self):
-        self.mhks = MerkleHellmanKnapsack()
+        self.mhks = None
+        if self.store is not None:
+            self.mhks = self.store.load_mhks(self.name)
+        if self.mhks is None:
+            self.mhks = MerkleHellmanKnapsack()
+            if self.store is not None:
+                self.store.save_mhks(self.name, self.mhks)
         self.privateMHKSKey, self.publicMHKSKey, self.q, self.r = self.mhks.returnKeys()
 
     def GenerateSignatureKeys(self,curve,ecdsa):
         #self.ecdsa = ECDSA()
         self.curve = curve
         self.ecdsa = ecdsa
-        self.privateSignatureKey, self.publicSignatureKey = self.ecdsa.generate_key_pair()
+        keys = None
+        if self.store is not None:
+            keys = self.store.load_ecdsa(self.name, curve)
+        if keys is None:
+            keys = self.ecdsa.generate_key_pair()
+            if self.store is not None:
+                self.store.save_ecdsa(self.name, keys[0])
+        self.privateSignatureKey, self.publicSignatureKey = keys
 
     def signOn(self, message):
         signedMessage = self.ecdsa.sign(self.privateSignatureKey,message)
@@ -35,16 +68,19 @@ class Person:
     def decryptRabbitKey(self, keyToDecrypt ,key):
         return self.mhks.decrypt(keyToDecrypt, key)
 
-def main():
-    alice = Person()
-    bob = Person()
+def main(store = None):
+    alice = Person('alice', store)
+    bob = Person('bob', store)
 
-    bob.GenerateMHKSKeys()
+    with Metrics.stage('mhks_keygen'):
+        bob.GenerateMHKSKeys()
         
     curve = EllipticCurve()
     ecdsa = ECDSA(curve)
-    alice.GenerateSignatureKeys(curve,ecdsa)
+    with Metrics.stage('ecdsa_keygen'):
+        alice.GenerateSignatureKeys(curve,ecdsa)
 
+    # only used to encrypt with Bob's public key, no keypair is generated
     mhks = MerkleHellmanKnapsack()
 
     file_path = 'file.txt'  # Assuming the file is in the same directory as your Python script
@@ -57,34 +93,40 @@ def main():
     print("Rabbit key before encryption is :",alice.rabbitKey)
 
     print("\nAlice now encrypt the message using the Rabbit algorithm")
-    encryptedMessage = Rabbit(alice.rabbitKey,0).encrypt(messageToSend)
+    with Metrics.stage('rabbit_encrypt'):
+        encryptedMessage = Rabbit(alice.rabbitKey,0).encrypt(messageToSend)
     print("\nEncrypted message  :",encryptedMessage) #message to send for bob
     encodedMessage = binascii.hexlify(encryptedMessage.encode()) 
     print("\nEncrypted message with regular signs :",encodedMessage)
 
     # Alice encrypt Rabbit key using Bob's public key with MHKS algorithm
     print("\nAlice now encrypt the Rabbit's key using the MHKS algorithm\n")
-    encryptedRabbitKey = mhks.encrypt(alice.rabbitKey, bob.publicMHKSKey)
+    with Metrics.stage('mhks_encrypt'):
+        encryptedRabbitKey = mhks.encrypt(alice.rabbitKey, bob.publicMHKSKey)
     print("Rabbit key after encryption is : ", encryptedRabbitKey)
    
     # Alice sign the message using her private key using ECDSA algorithm
     print("\nAlice now sign the message using the ECDSA algorithm")
-    signMessage = alice.signOn(messageToSend)
+    with Metrics.stage('ecdsa_sign'):
+        signMessage = alice.signOn(messageToSend)
 
     print("=========================================================================================")
     print("Bob now decrypts the Rabbit's key using the MHKS algorithm\n")
     # Bob decrypt the rabbit key using his private key and MHKS algorithm
-    decryptedRabbitKey = bob.decryptRabbitKey(encryptedRabbitKey, bob.privateMHKSKey)
+    with Metrics.stage('mhks_decrypt'):
+        decryptedRabbitKey = bob.decryptRabbitKey(encryptedRabbitKey, bob.privateMHKSKey)
     print("Rabbit key after decryption is : ", decryptedRabbitKey)
     
     # Bob decrypt the message using Rabbit algorithm
     print("\nBob now decrypts the message using the Rabbit algorithm\n")
-    text = Rabbit(decryptedRabbitKey,0).decrypt(encryptedMessage)
+    with Metrics.stage('rabbit_decrypt'):
+        text = Rabbit(decryptedRabbitKey,0).decrypt(encryptedMessage)
     print("Decrypted :",text)
 
     # Bob doing verification on message using Alice public key from ECDSA
     print("Bob now verify alice's signature using the ECDSA algorithm\n")
-    result = ecdsa.verify(alice.publicSignatureKey, text, signMessage)
+    with Metrics.stage('ecdsa_verify'):
+        result = ecdsa.verify(alice.publicSignatureKey, text, signMessage)
     if(result):
         print("----Verification complete----\n")
     if(not result):
@@ -95,5 +137,436 @@ def main():
         file.write(text)
 
 
+def _cipher(key, iv, cache):
+    # the shared key setup cache of Rabbit only helps long-lived keys (cache
+    # = True); one-shot session keys would always miss, push those out and
+    # stay in memory, so they get a plain Rabbit instance
+    if cache:
+        return RabbitCipher.cipher(key, iv)
+    return Rabbit(key, iv)
+
+def encrypt_file(key, in_path, out_path, iv = 0, chunk_size = CHUNK_SIZE, cache = False):
+    '''Encrypt/Decrypt a file with Rabbit one block at a time,
+    the memory used does not depend on the size of the file'''
+    with open(in_path, 'rb') as src, open(out_path, 'wb') as dst:
+        return _cipher(key, iv, cache).encrypt_stream(src, dst, chunk_size)
+
+decrypt_file = encrypt_file
+
+def write_signed_envelope(key, wrapped_key, ecdsa, private_key, public_key, in_path, out_path, iv = 0, chunk_size = CHUNK_SIZE, cache = False):
+    '''Write a WireFormat envelope to out_path, the file at in_path is
+    encrypted with Rabbit and signed in the same pass.
+    The signature is written into the header once the payload is done.
+    Returns the signature.'''
+    size = os.path.getsize(in_path)
+    with open(in_path, 'rb') as src, open(out_path, 'wb') as dst:
+        dst.write(WireFormat.encode_header(wrapped_key, (0, 0), public_key, size))
+        signature, total = Pipeline.encrypt_and_sign(_cipher(key, iv, cache), ecdsa, private_key, src, dst, chunk_size)
+        if total != size:
+            raise ValueError("%s changed while it was encrypted" % in_path)
+        dst.seek(WireFormat.signature_offset(wrapped_key))
+        dst.write(signature[0].to_bytes(WireFormat.COORD_BYTES, 'big') +
+                  signature[1].to_bytes(WireFormat.COORD_BYTES, 'big'))
+    return signature
+
+def write_multi_recipient_envelope(key, recipient_keys, ecdsa, private_key, public_key, in_path, out_path, iv = 0, chunk_size = CHUNK_SIZE, cache = False):
+    '''Encrypt and sign the file once for all the recipients: the Rabbit key
+    is wrapped for every MHKS public key of recipient_keys in one batch and
+    the envelope gets one key table entry per recipient. Returns the signature.'''
+    wrapped = MerkleHellmanKnapsack().encrypt_for_keys(key, recipient_keys)
+    recipients = [(WireFormat.key_fingerprint(k), w) for k, w in zip(recipient_keys, wrapped)]
+    size = os.path.getsize(in_path)
+    header = WireFormat.encode_multi_header(recipients, (0, 0), public_key, size)
+    with open(in_path, 'rb') as src, open(out_path, 'wb') as dst:
+        dst.write(header)
+        signature, total = Pipeline.encrypt_and_sign(_cipher(key, iv, cache), ecdsa, private_key, src, dst, chunk_size)
+        if total != size:
+            raise ValueError("%s changed while it was encrypted" % in_path)
+        dst.seek(len(header) - WireFormat.TRAILER_BYTES)
+        dst.write(signature[0].to_bytes(WireFormat.COORD_BYTES, 'big') +
+                  signature[1].to_bytes(WireFormat.COORD_BYTES, 'big'))
+    return signature
+
+def read_signed_envelope(person, sender_public_key, ecdsa, in_path, out_path, iv = 0, chunk_size = CHUNK_SIZE, cache = False):
+    '''Decrypt an envelope written by write_signed_envelope for person and
+    verify it in one pass. Returns True when the signature of
+    sender_public_key is valid.'''
+    with open(in_path, 'rb') as file, \
+         mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+        envelope = WireFormat.parse_envelope(data)
+        try:
+            key = person.decryptRabbitKey(envelope.wrapped_key_int(), person.privateMHKSKey)
+            with open(out_path, 'wb') as dst:
+                result, size = Pipeline.decrypt_and_verify(_cipher(key, iv, cache), ecdsa, sender_public_key,
+                                                           envelope.signature(), envelope.payload, dst, chunk_size)
+            return result and envelope.public_key_point(ecdsa.curve) == sender_public_key
+        finally:
+            envelope.release()
+
+def read_multi_recipient_envelope(person, sender_public_key, ecdsa, in_path, out_path, iv = 0, chunk_size = CHUNK_SIZE, cache = False):
+    '''The receiving side for one recipient (a Person with MHKS keys).
+    Returns True when the signature of sender_public_key is valid.'''
+    with open(in_path, 'rb') as file, \
+         mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+        envelope = WireFormat.parse_multi_envelope(data)
+        try:
+            key = person.decryptRabbitKey(envelope.wrapped_key_for(person.publicMHKSKey), person.privateMHKSKey)
+            with open(out_path, 'wb') as dst:
+                result, size = Pipeline.decrypt_and_verify(_cipher(key, iv, cache), ecdsa, sender_public_key,
+                                                           envelope.signature(), envelope.payload, dst, chunk_size)
+            return result and envelope.public_key_point(ecdsa.curve) == sender_public_key
+        finally:
+            envelope.release()
+
+def main_stream(file_path = 'file.txt', encrypted_path = 'file.enc', output_path = 'output.txt', store = None):
+    # same exchange as main() but the file is never fully loaded in memory,
+    # Alice writes one envelope file (see WireFormat) and Bob reads it back
+    alice = Person('alice', store)
+    bob = Person('bob', store)
+
+    with Metrics.stage('mhks_keygen'):
+        bob.GenerateMHKSKeys()
+
+    curve = EllipticCurve()
+    ecdsa = ECDSA(curve)
+    with Metrics.stage('ecdsa_keygen'):
+        alice.GenerateSignatureKeys(curve,ecdsa)
+
+    # only used to encrypt with Bob's public key, no keypair is generated
+    mhks = MerkleHellmanKnapsack()
+
+    print("=========================================================================================")
+    alice.rabbitKey = int(Rabbit_key, 16)
+    print("Rabbit key before encryption is :",alice.rabbitKey)
+
+    # Alice encrypt Rabbit key using Bob's public key with MHKS algorithm
+    print("\nAlice now encrypt the Rabbit's key using the MHKS algorithm\n")
+    with Metrics.stage('mhks_encrypt'):
+        encryptedRabbitKey = mhks.encrypt(alice.rabbitKey, bob.publicMHKSKey)
+    print("Rabbit key after encryption is : ", encryptedRabbitKey)
+
+    # Alice encrypt the file with Rabbit and sign it with ECDSA,
+    # both in a single pass over the file
+    print("\nAlice now encrypt the file using the Rabbit algorithm and sign it using the ECDSA algorithm")
+    with Metrics.stage('encrypt_and_sign'):
+        write_signed_envelope(alice.rabbitKey, encryptedRabbitKey, alice.ecdsa,
+                              alice.privateSignatureKey, alice.publicSignatureKey,
+                              file_path, encrypted_path, cache = True)
+    print("\nEncrypted", os.path.getsize(file_path), "bytes into", encrypted_path)
+
+    print("=========================================================================================")
+    # Bob maps the envelope, its fields are read in place
+    with open(encrypted_path, 'rb') as file, \
+         mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+        envelope = WireFormat.parse_envelope(data)
+        try:
+            print("Bob now decrypts the Rabbit's key using the MHKS algorithm\n")
+            with Metrics.stage('mhks_decrypt'):
+                decryptedRabbitKey = bob.decryptRabbitKey(envelope.wrapped_key_int(), bob.privateMHKSKey)
+            print("Rabbit key after decryption is : ", decryptedRabbitKey)
+
+            # the sender's key in the envelope must be the one Bob knows for Alice
+            sender = envelope.public_key_point(curve)
+
+            # Bob decrypt the file into output_path and verify alice's signature
+            # on it, both in a single pass over the payload
+            print("\nBob now decrypts the file using the Rabbit algorithm and verify alice's signature using the ECDSA algorithm\n")
+            with Metrics.stage('decrypt_and_verify'):
+                with open(output_path, 'wb') as file:
+                    result, size = Pipeline.decrypt_and_verify(RabbitCipher.cipher(decryptedRabbitKey, 0), ecdsa,
+                                                               alice.publicSignatureKey, envelope.signature(),
+                                                               envelope.payload, file, CHUNK_SIZE)
+            result = result and sender == alice.publicSignatureKey
+            print("Decrypted", size, "bytes into", output_path)
+        finally:
+            envelope.release()
+
+    if(result):
+        print("----Verification complete----\n")
+    if(not result):
+        print("----Verification failed----\n")
+
+
+def main_multi(count = 3, file_path = 'file.txt', encrypted_path = 'file.enc', store = None):
+    # Alice sends the same file to count receivers with a single envelope
+    alice = Person('alice', store)
+    receivers = [Person('receiver%d' % i, store) for i in range(count)]
+    for receiver in receivers:
+        receiver.GenerateMHKSKeys()
+
+    curve = EllipticCurve()
+    ecdsa = ECDSA(curve)
+    alice.GenerateSignatureKeys(curve,ecdsa)
+    alice.rabbitKey = int(Rabbit_key, 16)
+
+    print("=========================================================================================")
+    print("Alice now encrypt and sign the file once for", count, "receivers")
+    with Metrics.stage('encrypt_and_sign'):
+        write_multi_recipient_envelope(alice.rabbitKey, [receiver.publicMHKSKey for receiver in receivers],
+                                       ecdsa, alice.privateSignatureKey, alice.publicSignatureKey,
+                                       file_path, encrypted_path, cache = True)
+    print("Envelope of", os.path.getsize(encrypted_path), "bytes written into", encrypted_path)
+
+    print("=========================================================================================")
+    for i, receiver in enumerate(receivers):
+        output_path = '%s.%d.out' % (encrypted_path, i)
+        with Metrics.stage('decrypt_and_verify'):
+            result = read_multi_recipient_envelope(receiver, alice.publicSignatureKey, ecdsa, encrypted_path,
+                                                   output_path, cache = True)
+        print(receiver.name, "decrypted the file into", output_path,
+              "----Verification complete----" if result else "----Verification failed----")
+
+
+# Batch mode: python Main.py COMMAND SOURCE DESTINATION --keys FILE
+#   encrypt : every file of SOURCE -> DESTINATION/<path>.enc (signed envelope)
+#   decrypt : every .enc of SOURCE -> DESTINATION/<path> (only if verified)
+#   sign    : every file of SOURCE -> DESTINATION/<path>.sig (r and s)
+#   verify  : every file of SOURCE against DESTINATION/<path>.sig
+# The files are spread over a process pool, biggest first. A manifest of
+# the size and mtime of every file done and of its destination file is
+# kept, a file is skipped on the next run when neither of them changed.
+
+COMMANDS = ('encrypt', 'decrypt', 'sign', 'verify')
+ENCRYPTED_SUFFIX = '.enc'
+SIGNATURE_SUFFIX = '.sig'
+MANIFEST_NAME = '.manifest-%s.json'
+
+_batch = None # (sender, recipient, ecdsa) of the current process
+
+def _init_batch(keys_path, sender_name, recipient_name):
+    # loads the keys from the store, the parent process calls it first
+    # so the keys missing from the store are only generated once
+    global _batch
+    store = KeyStore(keys_path)
+    curve = EllipticCurve()
+    ecdsa = ECDSA(curve)
+    sender = Person(sender_name, store)
+    sender.GenerateSignatureKeys(curve, ecdsa)
+    recipient = Person(recipient_name, store)
+    recipient.GenerateMHKSKeys()
+    _batch = (sender, recipient, ecdsa)
+
+def _batch_job(command, src, dst):
+    # one file, returns (source, size, seconds, ok, error)
+    sender, recipient, ecdsa = _batch
+    start = time.perf_counter()
+    size = 0
+    ok = True
+    error = None
+    try:
+        # inside the try: the file may be gone since the scan
+        size = os.path.getsize(src)
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok = True)
+        if command == 'encrypt':
+            key = secrets.randbits(128) # new session key for every file
+            wrapped = recipient.mhks.encrypt(key, recipient.publicMHKSKey)
+            # the signature is only written at the end, a failed file must
+            # not be left at dst: written next to it and moved when complete
+            tmp = dst + '.tmp'
+            done = False
+            try:
+                write_signed_envelope(key, wrapped, ecdsa, sender.privateSignatureKey,
+                                      sender.publicSignatureKey, src, tmp)
+                os.replace(tmp, dst)
+                done = True
+            finally:
+                if not done and os.path.exists(tmp):
+                    os.remove(tmp)
+        elif command == 'decrypt':
+            # written next to the destination and only moved there when verified
+            tmp = dst + '.tmp'
+            ok = False
+            try:
+                ok = read_signed_envelope(recipient, sender.publicSignatureKey, ecdsa, src, tmp)
+                if ok:
+                    os.replace(tmp, dst)
+                else:
+                    error = 'signature verification failed'
+            finally:
+                # also when read_signed_envelope raised
+                if not ok and os.path.exists(tmp):
+                    os.remove(tmp)
+        elif command == 'sign':
+            with open(src, 'rb') as file:
+                r, s = ecdsa.sign_stream(sender.privateSignatureKey, file)
+            with open(dst, 'wb') as file:
+                file.write(r.to_bytes(WireFormat.COORD_BYTES, 'big') + s.to_bytes(WireFormat.COORD_BYTES, 'big'))
+        else:
+            with open(dst, 'rb') as file:
+                data = file.read()
+            if len(data) != 2 * WireFormat.COORD_BYTES:
+                raise ValueError("invalid signature file")
+            signature = (int.from_bytes(data[:WireFormat.COORD_BYTES], 'big'),
+                         int.from_bytes(data[WireFormat.COORD_BYTES:], 'big'))
+            with open(src, 'rb') as file:
+                ok = ecdsa.verify_stream(sender.publicSignatureKey, file, signature)
+            if not ok:
+                error = 'signature verification failed'
+    except (OSError, ValueError, KeyError) as exc:
+        ok = False
+        error = str(exc)
+    return src, size, time.perf_counter() - start, ok, error
+
+def _batch_files(command, source, destination):
+    # (relative path, source file, destination file) for every file to do
+    jobs = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if name.startswith('.manifest-'):
+                continue
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, source)
+            if command == 'decrypt':
+                if not rel.endswith(ENCRYPTED_SUFFIX):
+                    continue
+                dst = os.path.join(destination, rel[:-len(ENCRYPTED_SUFFIX)])
+            elif command == 'encrypt':
+                dst = os.path.join(destination, rel + ENCRYPTED_SUFFIX)
+            else:
+                dst = os.path.join(destination, rel + SIGNATURE_SUFFIX)
+            jobs.append((rel, src, dst))
+    return jobs
+
+def _load_manifest(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def _stamp(path):
+    # what the manifest remembers of a file
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def _save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp, path)
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_batch(command, source, destination, keys_path, sender = 'alice', recipient = 'bob',
+              workers = None, manifest_path = None, force = False):
+    '''Run a batch command over the tree source, returns the report as a dict'''
+    if manifest_path is None:
+        manifest_path = os.path.join(destination, MANIFEST_NAME % command)
+    manifest = {} if force else _load_manifest(manifest_path)
+    _init_batch(keys_path, sender, recipient)
+
+    jobs = []
+    skipped = 0
+    for rel, src, dst in _batch_files(command, source, destination):
+        stamp = _stamp(src)
+        # the entry holds the stamps of the source and of the destination
+        # (the .sig read by verify, the file written by the others): a file
+        # is only skipped when neither changed since it was done
+        entry = manifest.get(rel)
+        if entry is not None and entry[:2] == stamp and os.path.exists(dst) and entry[2:] == _stamp(dst):
+            skipped += 1
+            continue
+        jobs.append((stamp[1], rel, src, dst, stamp))
+    # biggest files first, the small ones fill the gaps at the end
+    jobs.sort(key = lambda job: job[0], reverse = True)
+    by_source = {src: (rel, dst, stamp) for size, rel, src, dst, stamp in jobs}
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    results = []
+    if workers <= 1 or len(jobs) <= 1:
+        for size, rel, src, dst, stamp in jobs:
+            results.append(_batch_job(command, src, dst))
+    else:
+        with ProcessPoolExecutor(workers, initializer = _init_batch,
+                                 initargs = (keys_path, sender, recipient)) as pool:
+            futures = [pool.submit(_batch_job, command, src, dst) for size, rel, src, dst, stamp in jobs]
+            for future in as_completed(futures):
+                results.append(future.result())
+    elapsed = time.perf_counter() - start
+
+    failures = []
+    for src, size, seconds, ok, error in results:
+        rel, dst, stamp = by_source[src]
+        if ok:
+            try:
+                manifest[rel] = stamp + _stamp(dst)
+            except OSError:
+                manifest.pop(rel, None)
+        else:
+            manifest.pop(rel, None)
+            failures.append({'file': rel, 'error': error})
+    _save_manifest(manifest_path, manifest)
+
+    total = sum(size for src, size, seconds, ok, error in results)
+    latencies = [seconds for src, size, seconds, ok, error in results]
+    return {'command': command,
+            'files': len(results),
+            'skipped': skipped,
+            'failed': len(failures),
+            'failures': failures,
+            'bytes': total,
+            'seconds': elapsed,
+            'mb_per_s': total / (1 << 20) / elapsed if elapsed else 0.0,
+            'latency_p50': _percentile(latencies, 0.50),
+            'latency_p95': _percentile(latencies, 0.95),
+            'latency_max': max(latencies) if latencies else 0.0,
+            'workers': workers}
+
+def cli(argv):
+    parser = argparse.ArgumentParser(prog = 'Main.py', description = 'Encrypt, decrypt, sign or verify directory trees')
+    parser.add_argument('command', choices = COMMANDS)
+    parser.add_argument('source', help = 'directory tree to process')
+    parser.add_argument('destination', help = 'output directory (the signatures for sign/verify)')
+    parser.add_argument('--keys', required = True, help = 'key store file, missing keys are generated')
+    parser.add_argument('--sender', default = 'alice', help = 'name of the signing person (default %(default)s)')
+    parser.add_argument('--recipient', default = 'bob', help = 'name of the receiving person (default %(default)s)')
+    parser.add_argument('--workers', type = int, help = 'processes (default: number of CPUs)')
+    parser.add_argument('--manifest', help = 'manifest file (default: in the destination directory)')
+    parser.add_argument('--force', action = 'store_true', help = 'ignore the manifest, process every file')
+    parser.add_argument('--json', help = 'write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    report = run_batch(args.command, args.source, args.destination, args.keys, args.sender,
+                       args.recipient, args.workers, args.manifest, args.force)
+    print("%s: %d files, %d skipped, %d failed, %.1f MB in %.2f s (%.2f MB/s)" %
+          (report['command'], report['files'], report['skipped'], report['failed'],
+           report['bytes'] / (1 << 20), report['seconds'], report['mb_per_s']))
+    print("latency per file: p50 %.3f s, p95 %.3f s, max %.3f s" %
+          (report['latency_p50'], report['latency_p95'], report['latency_max']))
+    for failure in report['failures']:
+        print("FAILED %s: %s" % (failure['file'], failure['error']))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent = 2)
+    return 1 if report['failed'] else 0
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:2] and sys.argv[1] in COMMANDS:
+        sys.exit(cli(sys.argv[1:]))
+
+    # --keys FILE keeps the keys of Alice and Bob in FILE between runs
+    args = sys.argv[1:]
+    store = None
+    if "--keys" in args:
+        store = KeyStore(args[args.index("--keys") + 1])
+    # --metrics FILE writes the timing of every stage and the counters as JSON
+    if "--metrics" in args:
+        Metrics.enable()
+    # --recipients N sends the file to N receivers with one envelope
+    if "--recipients" in args:
+        main_multi(int(args[args.index("--recipients") + 1]), store = store)
+    elif "--stream" in args:
+        main_stream(store = store)
+    else:
+        main(store)
+    if "--metrics" in args:
+        Metrics.to_json(args[args.index("--metrics") + 1])
\ No newline at end of file
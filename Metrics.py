@@ -0,0 +1,106 @@
+import json
+import time
+
+# Lightweight instrumentation, off by default.
+#
+# Hot code checks the module flag before counting, so when disabled the
+# cost is one attribute lookup per operation:
+#
+#     if Metrics.enabled:
+#         Metrics.count('ec.add')
+#
+# Timed stages use "with Metrics.stage('name'):". Every finished stage
+# is also passed to the hooks added with add_hook, to feed other
+# metrics systems.
+
+enabled = False
+
+counters = {}   # name -> value
+stages = {}     # name -> {'count', 'wall', 'cpu'} in seconds
+_hooks = []
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    counters.clear()
+    stages.clear()
+
+
+def count(name, n = 1):
+    counters[name] = counters.get(name, 0) + n
+
+
+def add_hook(callback):
+    '''callback(name, wall_seconds, cpu_seconds) is called after every stage'''
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    _hooks.remove(callback)
+
+
+class _Stage:
+    __slots__ = ('name', 'wall', 'cpu')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        entry = stages.get(self.name)
+        if entry is None:
+            entry = stages[self.name] = {'count': 0, 'wall': 0.0, 'cpu': 0.0}
+        entry['count'] += 1
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        for hook in _hooks:
+            hook(self.name, wall, cpu)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_no_stage = _NoStage()
+
+
+def stage(name):
+    '''Context manager timing a stage (wall and CPU time)'''
+    if not enabled:
+        return _no_stage
+    return _Stage(name)
+
+
+def snapshot():
+    return {'counters': dict(counters),
+            'stages': {name: dict(entry) for name, entry in stages.items()}}
+
+
+def to_json(path = None):
+    '''Returns the snapshot as JSON, and writes it to path when given'''
+    text = json.dumps(snapshot(), indent = 2, sort_keys = True)
+    if path is not None:
+        with open(path, 'w') as file:
+            file.write(text + '\n')
+    return text
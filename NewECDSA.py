@@ -1,44 +1,255 @@
 import hashlib
+import json
+import math
+import os
+import queue
 import random
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import Field
+import Metrics
+
+_batch_ecdsa = None # ECDSA instance of a verify_batch worker process
+
+def _init_batch_worker(table_cache_size, table_window):
+    global _batch_ecdsa
+    _batch_ecdsa = ECDSA(EllipticCurve(), table_cache_size, table_window)
+
+def _verify_batch_chunk(items):
+    # the cache stats go back with the results, see table_cache_stats
+    return os.getpid(), _batch_ecdsa.verify_batch(items), _batch_ecdsa.table_cache_stats()
 
 class ECDSA:
-    def __init__(self, curve):
+    def __init__(self, curve, table_cache_size = 64, table_window = 6):
         self.curve = curve
         self.n = curve.order
         self.G = curve.generator() # G(Gx,Gy)
+        # LRU cache of the wNAF odd multiples of public keys used by
+        # verify_batch: public key -> (table, size in bytes)
+        self.table_cache_size = table_cache_size
+        self.table_window = table_window
+        self._tables = OrderedDict()
+        self._tables_bytes = 0
+        self.table_cache_hits = 0
+        self.table_cache_misses = 0
+        self.nonce_pool = None # see enable_nonce_pool
+        # process pool of verify_batch(workers > 1), kept between calls so
+        # the table caches of the workers are too (see close_batch_pool)
+        self._batch_pool = None
+        self._batch_pool_workers = 0
+        self._worker_cache_stats = {} # worker pid -> its last table_cache_stats()
+
+    def __getstate__(self):
+        # the pool and the nonce pool thread belong to this process
+        state = self.__dict__.copy()
+        state['_batch_pool'] = None
+        state['_batch_pool_workers'] = 0
+        state['nonce_pool'] = None
+        return state
 
     def generate_key_pair(self):
         private_key = random.randint(1, self.n - 1) 
-        public_key = self.curve.multiply(self.G, private_key)
+        public_key = self.curve.multiply_generator(private_key)
         return private_key, public_key
 
     def sign(self, private_key, message):
-        z = self._hash_message(message) # hash the message
-        k = self._generate_random_k()  # generate a random k
-        r, _ = self.curve.multiply(self.G, k) # r = k(the random number) * G(the G'x and G'y where G is generator of the curve)
+        return self.sign_digest(private_key, self._digest(message))
+
+    def sign_stream(self, private_key, source, chunk_size = 1 << 16):
+        # sign data read from a binary file object or an iterable of
+        # bytes chunks, only one chunk is in memory at a time
+        return self.sign_digest(private_key, self.hash_stream(source, chunk_size))
+
+    def sign_digest(self, private_key, digest):
+        # sign a precomputed SHA-256 digest (bytes) of the message
+        z = self._digest_to_int(digest)
+        if self.nonce_pool is not None:
+            k, k_inverse, r = self.nonce_pool.get() # precomputed, used only once
+        else:
+            k, k_inverse, r = self._precompute_nonce()
         # s = k^-1 * (H(M) + r * private_key)
-        # first find the inverse of k
         # z = H(M)
-        s = self.curve.mod_inverse(k, self.n) * (z + r * private_key) % self.n
+        s = k_inverse * (z + r * private_key) % self.n
         return r, s # signature = (r,s)
 
+    def _precompute_nonce(self):
+        # everything in a signature that does not depend on the message
+        k = self._generate_random_k()  # generate a random k
+        r, _ = self.curve.multiply_generator(k) # r = k(the random number) * G(the G'x and G'y where G is generator of the curve)
+        # the inverse of k
+        return k, self.curve.mod_inverse(k, self.n), r
+
+    def enable_nonce_pool(self, depth = 64):
+        # sign() will take (k, k^-1, r) from a pool refilled in the background
+        if self.nonce_pool is None:
+            # build (or load) the table of G here, not in two threads at once
+            self.curve.generator_table()
+            self.nonce_pool = NoncePool(self, depth)
+            self.nonce_pool.start()
+        return self.nonce_pool
+
+    def disable_nonce_pool(self):
+        if self.nonce_pool is not None:
+            self.nonce_pool.stop()
+            self.nonce_pool = None
+
     def verify(self, public_key, message, signature):
-        z = self._hash_message(message) # hash the message
+        return self.verify_digest(public_key, self._digest(message), signature)
+
+    def verify_stream(self, public_key, source, signature, chunk_size = 1 << 16):
+        return self.verify_digest(public_key, self.hash_stream(source, chunk_size), signature)
+
+    def verify_digest(self, public_key, digest, signature):
+        z = self._digest_to_int(digest)
         r, s = signature # saving the signature components in r and s
+        if not (0 < r < self.n and 0 < s < self.n):
+            return False # same range check as verify_batch
         w = self.curve.mod_inverse(s, self.n) # calculating the opposite of s and saving it in w
         u1 = (z * w) % self.n # computing u1 = (z * w) mod n
         u2 = (r * w) % self.n # computing u2 = (r * w) mod n
 
         # x is the random point which serves in the sign process
-        x, _ = self.curve.add(self.curve.multiply(self.G, u1), self.curve.multiply(public_key, u2))
+        # u1*G + u2*public_key is computed in one pass
+        X = self.curve.joint_multiply(u1, self.G, u2, public_key)
+        if X is None:
+            return False # point at infinity, signature is not valid
+        x, _ = X
         if (r % self.n) == (x % self.n): # checking if r equals to x
             return True # signature is valid
         return False # signature is not valid
 
+    def verify_batch(self, items, workers = None):
+        # verify many (public_key, message, signature) tuples at once,
+        # returns a list of True/False in the same order.
+        # The wNAF table of every public key is kept in an LRU cache, all
+        # the s^-1 are computed with a single inversion and no result is
+        # converted back to affine coordinates.
+        # With workers > 1 the items are grouped by public key and spread
+        # over a process pool (every worker keeps its own cache). The pool
+        # is kept for the next calls, close_batch_pool() shuts it down.
+        items = list(items)
+        if workers is not None and workers > 1 and len(items) > 1:
+            return self._verify_batch_pool(items, workers)
+
+        n = self.n
+        p = self.curve.p
+        results = [False] * len(items)
+        todo = [] # (index, public_key, z, r, s) of the well formed signatures
+        for i, (public_key, message, signature) in enumerate(items):
+            r, s = signature
+            if 0 < r < n and 0 < s < n and public_key is not None:
+                todo.append((i, public_key, self._hash_message(message), r, s))
+
+        inverses = self.curve.batch_mod_inverse([s for i, Q, z, r, s in todo], n)
+        for (i, public_key, z, r, s), w in zip(todo, inverses):
+            table = (self._public_key_table(public_key), self.table_window)
+            X = self.curve.joint_multiply_jacobian(z * w % n, self.G, r * w % n, public_key, (None, table))
+            if X is None:
+                continue
+            # x = X / Z^2 and x mod n == r, so x is r or r + n (x < p)
+            ZZ = X[2] * X[2] % p
+            results[i] = (r * ZZ - X[0]) % p == 0 or \
+                         (r + n < p and ((r + n) * ZZ - X[0]) % p == 0)
+        return results
+
+    def _verify_batch_pool(self, items, workers):
+        groups = OrderedDict() # public key -> indexes of its items
+        for i, item in enumerate(items):
+            groups.setdefault(item[0], []).append(i)
+        order = [i for indexes in groups.values() for i in indexes]
+        size = -(-len(order) // (workers * 4)) # a few chunks per worker
+        chunks = [order[start:start + size] for start in range(0, len(order), size)]
+
+        results = [False] * len(items)
+        pool = self._get_batch_pool(workers)
+        jobs = [[items[i] for i in chunk] for chunk in chunks]
+        for chunk, (pid, chunk_results, stats) in zip(chunks, pool.map(_verify_batch_chunk, jobs)):
+            self._worker_cache_stats[pid] = stats
+            for i, result in zip(chunk, chunk_results):
+                results[i] = result
+        return results
+
+    def _get_batch_pool(self, workers):
+        if self._batch_pool is None or self._batch_pool_workers != workers:
+            self.close_batch_pool()
+            self._batch_pool = ProcessPoolExecutor(workers, initializer = _init_batch_worker,
+                                                   initargs = (self.table_cache_size, self.table_window))
+            self._batch_pool_workers = workers
+        return self._batch_pool
+
+    def close_batch_pool(self):
+        # shut the worker processes (and their table caches) down
+        if self._batch_pool is not None:
+            self._batch_pool.shutdown()
+            self._batch_pool = None
+            self._batch_pool_workers = 0
+        self._worker_cache_stats.clear()
+
+    def _public_key_table(self, public_key):
+        table = self._tables.get(public_key)
+        if table is not None:
+            self.table_cache_hits += 1
+            self._tables.move_to_end(public_key)
+            return table[0]
+
+        self.table_cache_misses += 1
+        table = self.curve.odd_multiples(public_key, self.table_window)
+        size = sys.getsizeof(table) + sum(sys.getsizeof(P) + sys.getsizeof(P[0]) + sys.getsizeof(P[1]) for P in table)
+        if self.table_cache_size > 0:
+            self._tables[public_key] = (table, size)
+            self._tables_bytes += size
+            while len(self._tables) > self.table_cache_size:
+                old_table, old_size = self._tables.popitem(last = False)[1]
+                self._tables_bytes -= old_size
+        return table
+
+    def table_cache_stats(self):
+        lookups = self.table_cache_hits + self.table_cache_misses
+        return {'hits': self.table_cache_hits,
+                'misses': self.table_cache_misses,
+                'hit_rate': self.table_cache_hits / lookups if lookups else 0.0,
+                'entries': len(self._tables),
+                'max_entries': self.table_cache_size,
+                'window': self.table_window,
+                'memory_bytes': self._tables_bytes,
+                # the caches of the verify_batch worker processes, as last
+                # reported by each of them
+                'workers': {pid: dict(stats) for pid, stats in self._worker_cache_stats.items()}}
+
+    def clear_table_cache(self):
+        self.close_batch_pool()
+        self._tables.clear()
+        self._tables_bytes = 0
+        self.table_cache_hits = 0
+        self.table_cache_misses = 0
+
+    def hash_stream(self, source, chunk_size = 1 << 16):
+        # SHA-256 digest of a binary file object or an iterable of chunks
+        hash_obj = hashlib.sha256()
+        if hasattr(source, 'read'):
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                hash_obj.update(chunk)
+        else:
+            for chunk in source:
+                hash_obj.update(chunk)
+        return hash_obj.digest()
+
+    def _digest(self, message):
+        return hashlib.sha256(message.encode()).digest()
+
+    def _digest_to_int(self, digest):
+        return int.from_bytes(digest, 'big') % self.n
+
     def _hash_message(self, message):
-        hash_obj = hashlib.sha256(message.encode())
-        hash_digest = int.from_bytes(hash_obj.digest(), 'big')
-        return hash_digest % self.n
+        return self._digest_to_int(self._digest(message))
 
     def _generate_random_k(self):
         while True:
@@ -46,8 +257,91 @@ class ECDSA:
             if self.curve.mod_inverse(k, self.n) != 0:
                 return k
 
+class NoncePool:
+    # bounded pool of precomputed (k, k^-1 mod n, r) tuples for ECDSA.sign,
+    # refilled by a background thread. Every tuple is handed out once.
+    def __init__(self, ecdsa, depth = 64):
+        self.ecdsa = ecdsa
+        self.depth = depth
+        self._queue = queue.Queue(maxsize = depth)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.produced = 0       # tuples computed by the background thread
+        self.consumed = 0       # tuples taken from the pool
+        self.empty_hits = 0     # times get() found the pool empty
+        self._busy_seconds = 0.0 # time the thread spent computing
+        self.errors = 0         # exceptions raised in the background thread
+        self.last_error = None  # repr of the last one
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target = self._refill, name = 'nonce-pool', daemon = True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _refill(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            try:
+                nonce = self.ecdsa._precompute_nonce()
+            except Exception as error:
+                # keep the thread alive, get() computes inline meanwhile
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = repr(error)
+                self._stop.wait(0.1)
+                continue
+            finally:
+                self._busy_seconds += time.perf_counter() - start
+            # wait for room in the pool, checking now and then for stop()
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(nonce, timeout = 0.1)
+                except queue.Full:
+                    continue
+                self.produced += 1
+                break
+
+    def get(self):
+        try:
+            nonce = self._queue.get_nowait()
+        except queue.Empty:
+            # never make the signer wait for the thread, compute it here
+            with self._lock:
+                self.empty_hits += 1
+            nonce = self.ecdsa._precompute_nonce()
+        with self._lock:
+            self.consumed += 1
+        return nonce
+
+    def stats(self):
+        return {'depth': self.depth,
+                'available': self._queue.qsize(),
+                'produced': self.produced,
+                'consumed': self.consumed,
+                'empty_hits': self.empty_hits,
+                'empty_rate': self.empty_hits / self.consumed if self.consumed else 0.0,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                # tuples per second of background thread work
+                'refill_rate': self.produced / self._busy_seconds if self._busy_seconds else 0.0}
+
 class EllipticCurve:
-    def __init__(self):
+    # bits of the scalar handled per lookup in the fixed-base table of G
+    GENERATOR_WINDOW = 4
+    # wNAF window widths used by joint_multiply, G's odd multiples are
+    # computed once so it gets a wider window than a one-off point
+    GENERATOR_WNAF_WINDOW = 8
+    WNAF_WINDOW = 5
+
+    def __init__(self, table_path = None):
         # y^2 = x^3 + 3
         # secp192k1 curve
         self.p = 0xfffffffffffffffffffffffffffffffffffffffeffffee37
@@ -57,6 +351,31 @@ class EllipticCurve:
         self.Gy = 0x9b2f2f6d9c5628a7844163d015be86344082aa88d95e2f9d # y of G on curve
         # order is the order of the generator of point G
         self.order = 0xfffffffffffffffffffffffe26f2fc170f69466a74defd8d # number of points on the curve = prime number
+        # p as a backend integer (see Field)
+        self.field = Field.PrimeField(self.p)
+        # fixed-base table of G, built on first use (see generator_table)
+        # and saved to / loaded from table_path when it is given
+        self.table_path = table_path
+        self._generator_table = None
+        self._generator_odd_multiples = None
+        # the table is built once even when several threads sign at once
+        # (see NoncePool)
+        self._generator_table_lock = threading.Lock()
+        # GLV: joint_multiply splits every scalar in two halves of half the
+        # size (see glv_split), can be turned off to compare
+        self.glv = self.a == 0
+        self._glv = None
+        self._generator_endomorphism_multiples = None
+
+    def __getstate__(self):
+        # locks cannot be pickled, the copy gets its own
+        state = self.__dict__.copy()
+        del state['_generator_table_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._generator_table_lock = threading.Lock()
 
     def generator(self):
         return self.Gx, self.Gy
@@ -68,15 +387,20 @@ class EllipticCurve:
             return P
         Px, Py = P
         Qx, Qy = Q
+        p = self.field.p
+        if Px == Qx and (P != Q or Py == 0):
+            return None # P = -Q, the result is the point at infinity
+        if Metrics.enabled:
+            Metrics.count('ec.double' if P == Q else 'ec.add')
         if P == Q:
             # m (lam) = (3x1^2 + a) / (2y1)    : Case 3 x1 = x2 and y1 = y2
             lam = (3 * Px * Px + self.a) * self.mod_inverse(2 * Py, self.p)
         else:
             # m (lam) = (y2 - y1) / (x2 - x1)    : Case 1 x1 != x2
             lam = (Qy - Py) * self.mod_inverse(Qx - Px, self.p)
-        Rx = (lam * lam - Px - Qx) % self.p # x3 = m^2 - x1 - x2
-        Ry = (lam * (Px - Rx) - Py) % self.p # y3 = m(x1 - x3) - y1
-        return Rx, Ry # coordinates of new point (Rx,Ry)
+        Rx = (lam * lam - Px - Qx) % p # x3 = m^2 - x1 - x2
+        Ry = (lam * (Px - Rx) - Py) % p # y3 = m(x1 - x3) - y1
+        return int(Rx), int(Ry) # coordinates of new point (Rx,Ry)
 
     def multiply(self, P, scalar):
         if scalar == 0:
@@ -88,18 +412,451 @@ class EllipticCurve:
             P = self.add(P, P)
         return Q
 
-    def mod_inverse(self, a, m):
-        if a < 0 or m <= a:
-            a = a % m # ensuring that a is in the range of 0 to n-1
-        c, d = a, m
-        uc, vc, ud, vd = 1, 0, 0, 1
-        while c != 0:
-            q, c, d = divmod(d, c) + (c,)
-            uc, vc, ud, vd = ud - q * uc, vd - q * vc, uc, vc
-        if ud > 0:
-            return ud
+    # Jacobian coordinates: the affine point (x, y) is (X, Y, Z) with
+    # x = X / Z^2 and y = Y / Z^3, so adding and doubling need no inversion.
+    # A whole scalar multiplication then does a single mod_inverse at the end.
+    # None is the point at infinity in both representations.
+
+    def to_jacobian(self, P):
+        if P is None:
+            return None
+        return P[0], P[1], 1
+
+    def from_jacobian(self, P):
+        if P is None:
+            return None
+        X, Y, Z = P
+        p = self.field.p
+        z = self.mod_inverse(Z, self.p) # the only inversion
+        zz = z * z % p
+        return int(X * zz % p), int(Y * zz * z % p)
+
+    def jacobian_double(self, P):
+        if P is None:
+            return None
+        X, Y, Z = P
+        if Y == 0:
+            return None
+        if Metrics.enabled:
+            Metrics.count('ec.double')
+        p = self.field.p
+        YY = Y * Y % p
+        S = 4 * X * YY % p # S = 4XY^2
+        if self.a:
+            ZZ = Z * Z % p
+            M = (3 * X * X + self.a * ZZ * ZZ) % p # M = 3X^2 + aZ^4
         else:
-            return ud + m
+            M = 3 * X * X % p # a = 0 for secp192k1 => M = 3X^2
+        X3 = (M * M - 2 * S) % p # X3 = M^2 - 2S
+        Y3 = (M * (S - X3) - 8 * YY * YY) % p # Y3 = M(S - X3) - 8Y^4
+        Z3 = 2 * Y * Z % p # Z3 = 2YZ
+        return X3, Y3, Z3
+
+    def jacobian_add(self, P, Q):
+        if P is None:
+            return Q
+        if Q is None:
+            return P
+        X1, Y1, Z1 = P
+        X2, Y2, Z2 = Q
+        p = self.field.p
+        Z1Z1 = Z1 * Z1 % p
+        Z2Z2 = Z2 * Z2 % p
+        U1 = X1 * Z2Z2 % p # both x's and y's brought to the same Z
+        U2 = X2 * Z1Z1 % p
+        S1 = Y1 * Z2 * Z2Z2 % p
+        S2 = Y2 * Z1 * Z1Z1 % p
+        if U1 == U2:
+            if S1 != S2:
+                return None # P = -Q
+            return self.jacobian_double(P) # P = Q
+        if Metrics.enabled:
+            Metrics.count('ec.add')
+        H = (U2 - U1) % p
+        R = (S2 - S1) % p
+        HH = H * H % p
+        HHH = H * HH % p
+        V = U1 * HH % p
+        X3 = (R * R - HHH - 2 * V) % p # X3 = R^2 - H^3 - 2U1H^2
+        Y3 = (R * (V - X3) - S1 * HHH) % p # Y3 = R(U1H^2 - X3) - S1H^3
+        Z3 = H * Z1 * Z2 % p # Z3 = H Z1 Z2
+        return X3, Y3, Z3
+
+    def jacobian_add_affine(self, P, Q):
+        # mixed addition, P in Jacobian and Q in affine coordinates (Z2 = 1)
+        if Q is None:
+            return P
+        if P is None:
+            return Q[0], Q[1], 1
+        X1, Y1, Z1 = P
+        X2, Y2 = Q
+        p = self.field.p
+        Z1Z1 = Z1 * Z1 % p
+        U2 = X2 * Z1Z1 % p
+        S2 = Y2 * Z1 * Z1Z1 % p
+        if X1 == U2:
+            if Y1 != S2:
+                return None
+            return self.jacobian_double(P)
+        if Metrics.enabled:
+            Metrics.count('ec.add')
+        H = (U2 - X1) % p
+        R = (S2 - Y1) % p
+        HH = H * H % p
+        HHH = H * HH % p
+        V = X1 * HH % p
+        X3 = (R * R - HHH - 2 * V) % p
+        Y3 = (R * (V - X3) - Y1 * HHH) % p
+        Z3 = H * Z1 % p
+        return X3, Y3, Z3
+
+    def multiply_jacobian(self, P, scalar):
+        # same result as multiply() but computed in Jacobian coordinates,
+        # left to right double and add
+        if scalar == 0 or P is None:
+            return None
+        Q = None
+        for i in range(scalar.bit_length() - 1, -1, -1):
+            Q = self.jacobian_double(Q)
+            if (scalar >> i) & 1:
+                Q = self.jacobian_add_affine(Q, P)
+        return self.from_jacobian(Q)
+
+    def batch_from_jacobian(self, points):
+        # converts many Jacobian points to affine with a single inversion
+        # (Montgomery's trick: invert the product of all Z, then peel it off)
+        p = self.field.p
+        prefix = []
+        acc = 1
+        for P in points:
+            prefix.append(acc)
+            if P is not None:
+                acc = acc * P[2] % p
+        inv = self.mod_inverse(acc, self.p)
+        result = [None] * len(points)
+        for i in range(len(points) - 1, -1, -1):
+            P = points[i]
+            if P is None:
+                continue
+            z = inv * prefix[i] % p # 1 / Z of this point
+            inv = inv * P[2] % p
+            zz = z * z % p
+            result[i] = (int(P[0] * zz % p), int(P[1] * zz * z % p))
+        return result
+
+    def generator_table(self):
+        # table[i][d - 1] = d * 2^(w*i) * G for every window i of the scalar
+        # and every non-zero window value d, so d * G needs no doubling
+        if self._generator_table is None:
+            with self._generator_table_lock:
+                if self._generator_table is None:
+                    table = None
+                    if self.table_path is not None and os.path.exists(self.table_path):
+                        table = self._load_generator_table(self.table_path)
+                    if table is None:
+                        table = self._build_generator_table()
+                        if self.table_path is not None:
+                            self._save_generator_table(self.table_path, table)
+                    self._generator_table = table
+        return self._generator_table
+
+    def _build_generator_table(self):
+        w = self.GENERATOR_WINDOW
+        windows = -(-self.order.bit_length() // w)
+        points = []
+        base = self.to_jacobian(self.generator()) # 2^(w*i) * G
+        for i in range(windows):
+            P = base
+            for d in range(1, 1 << w):
+                points.append(P)
+                P = self.jacobian_add(P, base)
+            base = P # (2^w) * 2^(w*i) * G
+        points = self.batch_from_jacobian(points)
+        size = (1 << w) - 1
+        return [points[i * size:(i + 1) * size] for i in range(windows)]
+
+    def _save_generator_table(self, path, table):
+        data = {'p': self.p, 'Gx': self.Gx, 'Gy': self.Gy,
+                'window': self.GENERATOR_WINDOW,
+                'points': [[list(P) for P in row] for row in table]}
+        # a unique temporary file next to path, so processes sharing the
+        # same table_path never write to the same file
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)),
+                                   prefix = os.path.basename(path) + '.', suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(data, file)
+            os.replace(tmp, path) # never leave a half written table behind
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _load_generator_table(self, path):
+        # returns None when the file does not match this curve, so the
+        # table is rebuilt (and the file rewritten) instead
+        try:
+            with open(path) as file:
+                data = json.load(file)
+            if (data['p'], data['Gx'], data['Gy'], data['window']) != \
+                    (self.p, self.Gx, self.Gy, self.GENERATOR_WINDOW):
+                return None
+            table = [[tuple(P) for P in row] for row in data['points']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        w = self.GENERATOR_WINDOW
+        if len(table) != -(-self.order.bit_length() // w) or \
+                any(len(row) != (1 << w) - 1 for row in table) or \
+                table[0][0] != self.generator() or \
+                not all(self.is_on_curve(P) for row in table for P in row):
+            return None
+        return table
+
+    def is_on_curve(self, P):
+        if P is None:
+            return True
+        x, y = P
+        return (y * y - x * x * x - self.a * x - self.b) % self.p == 0
+
+    def multiply_generator(self, scalar):
+        # scalar * G using the fixed-base table: one mixed addition per
+        # non-zero window of the scalar and no doubling at all
+        scalar %= self.order # G has order n
+        table = self.generator_table()
+        w = self.GENERATOR_WINDOW
+        mask = (1 << w) - 1
+        Q = None
+        i = 0
+        while scalar:
+            d = scalar & mask
+            if d:
+                Q = self.jacobian_add_affine(Q, table[i][d - 1])
+            scalar >>= w
+            i += 1
+        return self.from_jacobian(Q)
+
+    def negate(self, P):
+        if P is None:
+            return None
+        return P[0], (-P[1]) % self.p
+
+    def wnaf(self, scalar, w):
+        # width-w non-adjacent form, least significant digit first.
+        # Every non-zero digit is odd and |digit| < 2^(w-1), and any w
+        # consecutive digits hold at most one non-zero digit
+        digits = []
+        half = 1 << (w - 1)
+        full = 1 << w
+        while scalar:
+            if scalar & 1:
+                d = scalar & (full - 1)
+                if d >= half:
+                    d -= full
+                scalar -= d
+            else:
+                d = 0
+            digits.append(d)
+            scalar >>= 1
+        return digits
+
+    def odd_multiples(self, P, w):
+        # [P, 3P, 5P, ..., (2^(w-1) - 1)P] in affine coordinates
+        J = self.to_jacobian(P)
+        twice = self.jacobian_double(J)
+        points = [J]
+        for i in range((1 << (w - 2)) - 1):
+            points.append(self.jacobian_add(points[-1], twice))
+        return self.batch_from_jacobian(points)
+
+    def generator_odd_multiples(self):
+        if self._generator_odd_multiples is None:
+            self._generator_odd_multiples = self.odd_multiples(self.generator(), self.GENERATOR_WNAF_WINDOW)
+        return self._generator_odd_multiples
+
+    def joint_multiply(self, u1, P, u2, Q, tables = None):
+        return self.from_jacobian(self.joint_multiply_jacobian(u1, P, u2, Q, tables))
+
+    def joint_multiply_jacobian(self, u1, P, u2, Q, tables = None):
+        # u1*P + u2*Q with a single chain of doublings (Straus / Shamir's
+        # trick) over the interleaved wNAF of both scalars.
+        # tables can give ready odd multiples for P and/or Q as
+        # ((table, w), (table, w)), with None for the ones to compute.
+        # When P is the generator its cached table is used.
+        # With self.glv every scalar is split in two halves (k1 on R and k2
+        # on phi(R)), so the chain of doublings is half as long.
+        glv = self.glv and self.glv_constants() is not None
+        operands = []
+        for i, (u, R) in enumerate(((u1, P), (u2, Q))):
+            if R is None or u == 0:
+                continue
+            given = tables[i] if tables is not None else None
+            is_generator = R == self.generator()
+            if given is not None:
+                table, w = given
+            elif is_generator:
+                table, w = self.generator_odd_multiples(), self.GENERATOR_WNAF_WINDOW
+            else:
+                w = self.WNAF_WINDOW
+                table = self.odd_multiples(R, w)
+            if not glv:
+                operands.append((self.wnaf(u, w), table))
+                continue
+            k1, k2 = self.glv_split(u)
+            if is_generator and given is None:
+                endomorphism_table = self.generator_endomorphism_multiples()
+            else:
+                endomorphism_table = [self.endomorphism(T) for T in table]
+            operands.append((self.signed_wnaf(k1, w), table))
+            operands.append((self.signed_wnaf(k2, w), endomorphism_table))
+        return self._straus(operands)
+
+    def multiply_glv(self, P, scalar):
+        # same result as multiply(), scalar * P = k1 * P + k2 * phi(P)
+        # with the two halves evaluated jointly
+        if self.glv_constants() is None:
+            return self.multiply_jacobian(P, scalar)
+        if P is None or scalar % self.order == 0:
+            return None
+        k1, k2 = self.glv_split(scalar)
+        w = self.WNAF_WINDOW
+        table = self.odd_multiples(P, w)
+        return self.from_jacobian(self._straus([
+            (self.signed_wnaf(k1, w), table),
+            (self.signed_wnaf(k2, w), [self.endomorphism(T) for T in table])]))
+
+    def _straus(self, operands):
+        # sum of the (wNAF digits, odd multiples) operands, in Jacobian
+        # coordinates, sharing one chain of doublings
+        if not operands:
+            return None
+
+        p = self.field.p
+        add = self.jacobian_add_affine
+        double = self.jacobian_double
+        length = max(len(digits) for digits, table in operands)
+        S = None
+        for i in range(length - 1, -1, -1):
+            S = double(S)
+            for digits, table in operands:
+                if i < len(digits):
+                    d = digits[i]
+                    if d > 0:
+                        S = add(S, table[d >> 1])
+                    elif d < 0:
+                        x, y = table[(-d) >> 1]
+                        S = add(S, (x, p - y)) # adding -(|d| * R)
+        return S
+
+    # GLV endomorphism. On y^2 = x^3 + b with p = 1 mod 3 the map
+    # phi(x, y) = (beta * x, y), beta a cube root of unity mod p, is a
+    # multiplication by lambda, a cube root of unity mod n. A scalar k is
+    # written k = k1 + k2 * lambda (mod n) with k1, k2 of about half the
+    # size of n (Gallant, Lambert, Vanstone), using a short basis of the
+    # lattice {(x, y) : x + y * lambda = 0 mod n}.
+
+    def glv_constants(self):
+        # (beta, lambda, ((a1, b1), (a2, b2))), None when the curve has no
+        # such endomorphism. Computed once.
+        if self._glv is None:
+            self._glv = self._compute_glv_constants() or ()
+        return self._glv or None
+
+    def _compute_glv_constants(self):
+        p, n = self.p, self.order
+        if self.a != 0 or p % 3 != 1 or n % 3 != 1:
+            return None
+        beta = self._cube_root_of_unity(p)
+        lam = self._cube_root_of_unity(n)
+        # the two nontrivial roots are beta and beta^2 (same for lambda),
+        # pick the beta that goes with this lambda
+        G = self.generator()
+        lam_G = self.multiply_jacobian(G, lam)
+        for candidate in (beta, beta * beta % p):
+            if lam_G == (candidate * G[0] % p, G[1]):
+                return candidate, lam, self._glv_basis(lam)
+        return None
+
+    def _cube_root_of_unity(self, m):
+        # a cube root of 1 other than 1, modulo the prime m (m = 1 mod 3)
+        for g in range(2, m):
+            root = pow(g, (m - 1) // 3, m)
+            if root != 1:
+                return root
+
+    def _glv_basis(self, lam):
+        # extended Euclid on (n, lambda): every remainder r_i satisfies
+        # r_i = s_i * n + t_i * lambda, so (r_i, -t_i) is in the lattice.
+        # The short vectors are around the first remainder below sqrt(n).
+        n = self.order
+        sqrt_n = math.isqrt(n)
+        remainders = [n, lam]
+        ts = [0, 1]
+        while remainders[-1] >= sqrt_n:
+            q = remainders[-2] // remainders[-1]
+            remainders.append(remainders[-2] - q * remainders[-1])
+            ts.append(ts[-2] - q * ts[-1])
+        # remainders[-1] is r_(l+1), the first one below sqrt(n)
+        q = remainders[-2] // remainders[-1]
+        r_next = remainders[-2] - q * remainders[-1]
+        t_next = ts[-2] - q * ts[-1]
+        a1, b1 = remainders[-1], -ts[-1]
+        if remainders[-2] ** 2 + ts[-2] ** 2 <= r_next ** 2 + t_next ** 2:
+            a2, b2 = remainders[-2], -ts[-2]
+        else:
+            a2, b2 = r_next, -t_next
+        return (a1, b1), (a2, b2)
+
+    def glv_split(self, scalar):
+        # (k1, k2) with scalar = k1 + k2 * lambda (mod n), |k1|, |k2| < ~sqrt(n).
+        # k1 and k2 may be negative.
+        beta, lam, ((a1, b1), (a2, b2)) = self.glv_constants()
+        n = self.order
+        k = scalar % n
+        # c1, c2 = round(b2 * k / n), round(-b1 * k / n)
+        c1 = (2 * b2 * k + n) // (2 * n)
+        c2 = (-2 * b1 * k + n) // (2 * n)
+        return k - c1 * a1 - c2 * a2, -c1 * b1 - c2 * b2
+
+    def endomorphism(self, P):
+        # phi(P) = lambda * P
+        if P is None:
+            return None
+        return P[0] * self.glv_constants()[0] % self.p, P[1]
+
+    def generator_endomorphism_multiples(self):
+        # phi of generator_odd_multiples()
+        if self._generator_endomorphism_multiples is None:
+            self._generator_endomorphism_multiples = [self.endomorphism(T) for T in self.generator_odd_multiples()]
+        return self._generator_endomorphism_multiples
+
+    def signed_wnaf(self, scalar, w):
+        # wnaf() of a scalar that may be negative
+        if scalar < 0:
+            return [-d for d in self.wnaf(-scalar, w)]
+        return self.wnaf(scalar, w)
+
+    def batch_mod_inverse(self, values, m):
+        # inverses of all the values modulo m with a single mod_inverse
+        # (Montgomery's trick), no value may be 0 mod m
+        prefix = []
+        acc = 1
+        for v in values:
+            prefix.append(acc)
+            acc = acc * v % m
+        inv = self.mod_inverse(acc, m) if values else 1
+        result = [0] * len(values)
+        for i in range(len(values) - 1, -1, -1):
+            result[i] = inv * prefix[i] % m
+            inv = inv * values[i] % m
+        return result
+
+    def mod_inverse(self, a, m):
+        if Metrics.enabled:
+            Metrics.count('ec.mod_inverse')
+        # pow(a, -1, m) or gmpy2.invert, see Field
+        a %= m
+        if not a:
+            raise ZeroDivisionError("0 has no inverse modulo %d" % m)
+        return int(Field.inverse(a, m))
 
 
 # Define elliptic curve parameters
@@ -0,0 +1,96 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Fused single-pass stages: every chunk is read once and goes both to the
+# Rabbit cipher and to an incremental SHA-256. The hashing runs on its own
+# thread (hashlib releases the GIL on large updates) while the main thread
+# encrypts or decrypts the chunk. Two buffers are used in turn, a buffer is
+# only refilled after the hashing thread is done with it.
+
+CHUNK_SIZE = 1 << 20
+
+
+def _wait(future):
+    if future is not None:
+        future.result()
+
+
+def encrypt_and_sign(cipher, ecdsa, private_key, src, dst, chunk_size = CHUNK_SIZE):
+    '''Encrypt the binary file object src into dst with cipher (a Rabbit
+    instance) and sign the plaintext, in a single pass.
+    Returns (signature, number of bytes).'''
+    hash_obj = hashlib.sha256()
+    buffers = [bytearray(chunk_size), bytearray(chunk_size)]
+    pending = [None, None] # hashing of each buffer
+    out = bytearray(chunk_size)
+    out_view = memoryview(out)
+    total = 0
+    i = 0
+    with ThreadPoolExecutor(1) as hasher: # one thread keeps the updates in order
+        while True:
+            _wait(pending[i])
+            n = src.readinto(buffers[i])
+            if not n:
+                break
+            chunk = memoryview(buffers[i])[:n]
+            pending[i] = hasher.submit(hash_obj.update, chunk)
+            cipher.encrypt_into(chunk, out) # only reads chunk, safe while it is hashed
+            dst.write(out_view[:n])
+            total += n
+            i ^= 1
+        _wait(pending[i ^ 1])
+    return ecdsa.sign_digest(private_key, hash_obj.digest()), total
+
+
+def _chunks(src, chunk_size):
+    # chunks of a binary file object (one reused buffer) or of a buffer
+    # such as the payload view of an envelope (no copy)
+    if hasattr(src, 'readinto'):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            n = src.readinto(buffer)
+            if not n:
+                return
+            yield view[:n]
+    else:
+        # every view is released, also when the caller fails or stops
+        # early (it closes the generator), or an mmap under them could
+        # not be closed while the traceback is alive
+        view = memoryview(src).cast('B')
+        try:
+            for start in range(0, len(view), chunk_size):
+                chunk = view[start:start + chunk_size]
+                try:
+                    yield chunk
+                finally:
+                    chunk.release()
+        finally:
+            view.release()
+
+
+def decrypt_and_verify(cipher, ecdsa, public_key, signature, src, dst, chunk_size = CHUNK_SIZE):
+    '''Decrypt src (binary file object or buffer) into dst and verify the
+    signature of the plaintext, in a single pass.
+    Returns (True/False, number of bytes).'''
+    hash_obj = hashlib.sha256()
+    buffers = [bytearray(chunk_size), bytearray(chunk_size)]
+    pending = [None, None]
+    total = 0
+    i = 0
+    chunks = _chunks(src, chunk_size)
+    with ThreadPoolExecutor(1) as hasher:
+        try:
+            for chunk in chunks:
+                n = len(chunk)
+                _wait(pending[i])
+                cipher.decrypt_into(chunk, buffers[i])
+                plaintext = memoryview(buffers[i])[:n]
+                pending[i] = hasher.submit(hash_obj.update, plaintext)
+                dst.write(plaintext)
+                total += n
+                i ^= 1
+        finally:
+            chunks.close() # releases the views of src
+        _wait(pending[i ^ 1])
+    return ecdsa.verify_digest(public_key, hash_obj.digest(), signature), total
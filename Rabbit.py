@@ -3,6 +3,12 @@ import hashlib
 # import that used for converting binary data to ASCII
 # encoded hexadecimal strings
 import binascii
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import Metrics
 
 
 def enc_long(n):
@@ -24,6 +30,19 @@ def enc_long(n):
 # represent the maximum value of a 32 bit unsigned integer
 WORDSIZE = 0x100000000
 
+# number of bytes XORed at once by the bytes API, keeps the temporary
+# keystream and integers small even for very large buffers
+XOR_CHUNK = 1 << 16
+
+# default bounds of the keyed context cache (see RabbitContextCache)
+CONTEXT_CACHE_ENTRIES = 256
+CONTEXT_CACHE_BYTES = 1 << 20
+
+# default size of the keystream ring of KeystreamPrefetch, and the number
+# of bytes its thread generates at a time
+PREFETCH_DEPTH = 1 << 16
+PREFETCH_CHUNK = 1 << 10
+
 # lambada function for rotating bites left by 8 and 16 positions respectively
 # shifting x left 8 positions performing with the result bitwise AND with 0xFFFFFFFF
 # then performing with the result bitwise OR with shifting x to the right 24 positions
@@ -40,6 +59,9 @@ def _nsf(u, v):
 
 class Rabbit:
 
+    # KeystreamPrefetch feeding keystream_bytes(), see enable_prefetch
+    prefetch = None
+
     # sets up the internal state variables
     def __init__(self, key, iv = None):
         '''Initialize Rabbit cipher using a 128 bit integer/string'''
@@ -92,6 +114,8 @@ class Rabbit:
     def reset(self, iv = None):
         '''Reset the cipher and optionally set a new IV (int64 / string).'''
         
+        # the prefetched keystream belongs to the old position
+        self._drop_prefetch()
         # restore the cipher states that stored in the backup variables
         self.c = self.start_c[:]
         self.x = self.start_x[:]
@@ -114,6 +138,8 @@ class Rabbit:
                 i = (i << 8) | ord(c)
             iv = i
 
+        # the thread must not advance the state while it is changed here
+        self._drop_prefetch()
         c = self.c
 
         # split the 64-bit iv into 4 16-bit components
@@ -132,15 +158,16 @@ class Rabbit:
         c[6] ^= i2
         c[7] ^= i3
 
-        next(self)
-        next(self)
-        next(self)
-        next(self)
+        # same as calling next(self) four times
+        self._blocks(4)
         
 
     def __next__(self):
         '''Proceed to the next internal state'''
         
+        if Metrics.enabled:
+            Metrics.count('rabbit.next')
+
         # counter array
         c = self.c
         # state array
@@ -198,6 +225,8 @@ class Rabbit:
         '''Generate a keystream of n bytes'''
         
         res = "" # empty string to store the generated keystream
+        if Metrics.enabled:
+            Metrics.count('rabbit.bytes', n)
         
         # the buffer and the number of bytes in the buffer
         b = self._buf
@@ -257,6 +286,445 @@ class Rabbit:
 
     decrypt = encrypt
 
+    # Bytes API
+    # unlike keystream()/encrypt() above, every derive() here gives a full
+    # 16-byte block (most significant byte first, as in RFC 4503) and the
+    # data is XORed a whole chunk at a time. The two APIs produce different
+    # keystreams, so data encrypted with one must be decrypted with the
+    # same one and they should not be mixed on the same instance.
+
+    def _blocks(self, count):
+        '''Advance the state count times and return the derived 128 bit
+        blocks as a list. Same as calling next() and derive() in a loop,
+        but with the state kept in local variables.'''
+
+        if Metrics.enabled:
+            Metrics.count('rabbit.next', count)
+
+        c0, c1, c2, c3, c4, c5, c6, c7 = self.c
+        x0, x1, x2, x3, x4, x5, x6, x7 = self.x
+        b = self.b
+        M = 0xFFFFFFFF
+        out = []
+        append = out.append
+
+        for i in range(count):
+            # counter update, the carry is passed along in t >> 32
+            t = c0 + 0x4D34D34D + b;        c0 = t & M
+            t = c1 + 0xD34D34D3 + (t >> 32); c1 = t & M
+            t = c2 + 0x34D34D34 + (t >> 32); c2 = t & M
+            t = c3 + 0x4D34D34D + (t >> 32); c3 = t & M
+            t = c4 + 0xD34D34D3 + (t >> 32); c4 = t & M
+            t = c5 + 0x34D34D34 + (t >> 32); c5 = t & M
+            t = c6 + 0x4D34D34D + (t >> 32); c6 = t & M
+            t = c7 + 0xD34D34D3 + (t >> 32); c7 = t & M
+            b = t >> 32
+
+            # g functions (same as _nsf)
+            s = ((x0 + c0) & M) ** 2; g0 = (s ^ (s >> 32)) & M
+            s = ((x1 + c1) & M) ** 2; g1 = (s ^ (s >> 32)) & M
+            s = ((x2 + c2) & M) ** 2; g2 = (s ^ (s >> 32)) & M
+            s = ((x3 + c3) & M) ** 2; g3 = (s ^ (s >> 32)) & M
+            s = ((x4 + c4) & M) ** 2; g4 = (s ^ (s >> 32)) & M
+            s = ((x5 + c5) & M) ** 2; g5 = (s ^ (s >> 32)) & M
+            s = ((x6 + c6) & M) ** 2; g6 = (s ^ (s >> 32)) & M
+            s = ((x7 + c7) & M) ** 2; g7 = (s ^ (s >> 32)) & M
+
+            # rotations by 16 and 8 bits
+            r0 = ((g0 << 16) & M) | (g0 >> 16)
+            r1 = ((g1 << 16) & M) | (g1 >> 16)
+            r2 = ((g2 << 16) & M) | (g2 >> 16)
+            r3 = ((g3 << 16) & M) | (g3 >> 16)
+            r4 = ((g4 << 16) & M) | (g4 >> 16)
+            r5 = ((g5 << 16) & M) | (g5 >> 16)
+            r6 = ((g6 << 16) & M) | (g6 >> 16)
+            r7 = ((g7 << 16) & M) | (g7 >> 16)
+
+            x0 = (g0 + r7 + r6) & M
+            x1 = (g1 + (((g0 << 8) & M) | (g0 >> 24)) + g7) & M
+            x2 = (g2 + r1 + r0) & M
+            x3 = (g3 + (((g2 << 8) & M) | (g2 >> 24)) + g1) & M
+            x4 = (g4 + r3 + r2) & M
+            x5 = (g5 + (((g4 << 8) & M) | (g4 >> 24)) + g3) & M
+            x6 = (g6 + r5 + r4) & M
+            x7 = (g7 + (((g6 << 8) & M) | (g6 >> 24)) + g5) & M
+
+            # same as derive()
+            append(((x0 & 0xFFFF) ^ (x5 >> 16)) |
+                   (((x0 >> 16) ^ (x3 & 0xFFFF)) << 16) |
+                   (((x2 & 0xFFFF) ^ (x7 >> 16)) << 32) |
+                   (((x2 >> 16) ^ (x5 & 0xFFFF)) << 48) |
+                   (((x4 & 0xFFFF) ^ (x1 >> 16)) << 64) |
+                   (((x4 >> 16) ^ (x7 & 0xFFFF)) << 80) |
+                   (((x6 & 0xFFFF) ^ (x3 >> 16)) << 96) |
+                   (((x6 >> 16) ^ (x1 & 0xFFFF)) << 112))
+
+        # store the state back (in place, the lists may be shared)
+        self.c[:] = c0, c1, c2, c3, c4, c5, c6, c7
+        self.x[:] = x0, x1, x2, x3, x4, x5, x6, x7
+        self.b = b
+        return out
+
+    def keystream_bytes(self, n):
+        '''Generate a keystream of n bytes as a bytes object'''
+
+        if Metrics.enabled:
+            Metrics.count('rabbit.bytes', n)
+        if self.prefetch is not None:
+            return self.prefetch.read(n)
+        out = [] # list of keystream pieces, joined once at the end
+
+        # the buffer (the unused low bytes of the last block)
+        # and the number of bytes left in the buffer
+        b = self._buf
+        j = self._buf_bytes
+
+        # first use what is left from the previous call
+        if j and n:
+            take = min(j, n)
+            j -= take
+            out.append((b >> (j << 3)).to_bytes(take, 'big'))
+            b &= (1 << (j << 3)) - 1
+            n -= take
+
+        # whole 16-byte blocks, plus one more for a partial block
+        blocks, rem = divmod(n, 16)
+        derived = self._blocks(blocks + (1 if rem else 0))
+        if rem:
+            last = derived.pop()
+        out.extend([block.to_bytes(16, 'big') for block in derived])
+
+        # partial block, the rest is kept in the buffer for the next call
+        if rem:
+            j = 16 - rem
+            out.append((last >> (j << 3)).to_bytes(rem, 'big'))
+            b = last & ((1 << (j << 3)) - 1)
+
+        self._buf = b
+        self._buf_bytes = j
+        return b''.join(out)
+
+    def encrypt_into(self, src, dst):
+        '''Encrypt/Decrypt the buffer src into the writable buffer dst.
+        Both can be any object supporting the buffer protocol (bytes,
+        bytearray, memoryview, mmap...) and may be the same object.
+        Returns the number of bytes written.'''
+
+        src = memoryview(src).cast('B')
+        dst = memoryview(dst).cast('B')
+        n = len(src)
+        if len(dst) < n:
+            raise ValueError("destination buffer is smaller than the source")
+
+        keystream = self.keystream_bytes
+        for start in range(0, n, XOR_CHUNK):
+            end = min(start + XOR_CHUNK, n)
+            size = end - start
+            # XOR the whole chunk at once as one big integer
+            x = int.from_bytes(src[start:end], 'little') ^ \
+                int.from_bytes(keystream(size), 'little')
+            dst[start:end] = x.to_bytes(size, 'little')
+        return n
+
+    def encrypt_inplace(self, buf):
+        '''Encrypt/Decrypt a writable buffer in place'''
+        return self.encrypt_into(buf, buf)
+
+    def encrypt_bytes(self, data):
+        '''Encrypt/Decrypt a bytes-like object, returns bytes'''
+        res = bytearray(len(memoryview(data).cast('B')))
+        self.encrypt_into(data, res)
+        return bytes(res)
+
+    def encrypt_stream(self, src, dst, chunk_size = XOR_CHUNK * 16):
+        '''Encrypt/Decrypt everything read from the binary file object src
+        and write it to dst, chunk_size bytes at a time. The keystream
+        position is carried in _buf/_buf_bytes between chunks, so any
+        chunk size gives the same result. Returns the number of bytes.'''
+
+        buf = bytearray(chunk_size) # one buffer reused for every chunk
+        view = memoryview(buf)
+        total = 0
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            self.encrypt_inplace(view[:n])
+            dst.write(view[:n])
+            total += n
+        return total
+
+    decrypt_into = encrypt_into
+    decrypt_inplace = encrypt_inplace
+    decrypt_bytes = encrypt_bytes
+    decrypt_stream = encrypt_stream
+
+    def enable_prefetch(self, depth = PREFETCH_DEPTH, high = None, low = None):
+        '''Generate the keystream of the bytes API ahead of time in a
+        background thread, so encrypt_bytes()/encrypt_into() of small
+        messages only XOR. See KeystreamPrefetch for the parameters.
+        The output is the same as without prefetching. set_iv() and
+        reset() stop prefetching and drop the prefetched keystream.'''
+        if self.prefetch is None:
+            # the keystream left from the last call goes first in the ring,
+            # the carry is only cleared once the ring is built (it checks
+            # its parameters)
+            pending = self._buf.to_bytes(self._buf_bytes, 'big')
+            prefetch = KeystreamPrefetch(self, depth, high, low, pending)
+            self._buf = 0
+            self._buf_bytes = 0
+            self.prefetch = prefetch
+            prefetch.start()
+        return self.prefetch
+
+    def disable_prefetch(self):
+        '''Stop the prefetch thread, the keystream already in the ring
+        is kept and used by the next calls'''
+        if self.prefetch is not None:
+            pending = self.prefetch.stop()
+            self.prefetch = None
+            self._buf = int.from_bytes(pending, 'big')
+            self._buf_bytes = len(pending)
+
+    def _drop_prefetch(self):
+        # stop prefetching and discard the prefetched keystream
+        if self.prefetch is not None:
+            self.prefetch.stop()
+            self.prefetch = None
+
+
+class KeystreamPrefetch:
+    '''Bounded ring of keystream bytes of a Rabbit instance, refilled by a
+    background thread. The thread fills the ring up to the high watermark,
+    then sleeps until readers bring it down to the low watermark. A reader
+    that finds the ring empty waits for the thread (counted in empty_waits).
+
+    While it runs the thread is the only one advancing the cipher state,
+    the cipher's keystream_bytes() takes its bytes from read().
+    As the thread holds the GIL while it generates, the gain is for
+    messages spaced out in time (the ring is filled in between), not for
+    bulk throughput.'''
+
+    def __init__(self, cipher, depth = PREFETCH_DEPTH, high = None, low = None, pending = b''):
+        if high is None:
+            high = depth
+        if low is None:
+            low = high // 2
+        if depth < 16 or not 0 <= low < high <= depth:
+            raise ValueError("need 16 <= depth and 0 <= low < high <= depth")
+        if len(pending) > depth:
+            raise ValueError("pending keystream does not fit in the ring")
+        self.cipher = cipher
+        self.depth = depth
+        self.high = high
+        self.low = low
+        self._ring = bytearray(depth)
+        self._head = 0 # next byte to read
+        self._fill = 0 # bytes available from _head on (wrapping around)
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.produced = 0       # bytes generated by the thread
+        self.consumed = 0       # bytes read
+        self.reads = 0          # calls to read()
+        self.empty_waits = 0    # reads that found the ring empty and waited
+        self.wait_seconds = 0.0 # time spent waiting by those reads
+        self._write(pending)
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target = self._refill, name = 'rabbit-prefetch', daemon = True)
+            self._thread.start()
+
+    def stop(self):
+        '''Stop the thread and return the keystream left in the ring'''
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            return self._take(self._fill)
+
+    def _write(self, data):
+        # append data at the tail of the ring, the caller checked the room
+        n = len(data)
+        tail = (self._head + self._fill) % self.depth
+        first = min(n, self.depth - tail)
+        self._ring[tail:tail + first] = data[:first]
+        self._ring[:n - first] = data[first:]
+        self._fill += n
+
+    def _take(self, n):
+        # remove n bytes from the head of the ring
+        head = self._head
+        first = min(n, self.depth - head)
+        data = bytes(self._ring[head:head + first])
+        if first < n:
+            data += self._ring[:n - first]
+        self._head = (head + n) % self.depth
+        self._fill -= n
+        return data
+
+    def _refill(self):
+        cond = self._cond
+        blocks = self.cipher._blocks
+        filling = True
+        while True:
+            with cond:
+                while True:
+                    if not self._running:
+                        return
+                    if self._fill <= self.low:
+                        filling = True
+                    room = self.depth - self._fill
+                    if filling and self._fill < self.high and room >= 16:
+                        break
+                    filling = False # above the high watermark, sleep until low
+                    cond.wait()
+            # generate outside of the lock, readers can take what is there
+            count = min(PREFETCH_CHUNK, room, self.high - self._fill + 15) // 16
+            data = b''.join([block.to_bytes(16, 'big') for block in blocks(count)])
+            with cond:
+                self._write(data)
+                self.produced += len(data)
+                cond.notify_all()
+
+    def read(self, n):
+        '''The next n bytes of keystream, waits for the thread when the
+        ring does not hold them yet'''
+        out = []
+        with self._cond:
+            self.reads += 1
+            waited = False
+            while n:
+                if not self._fill:
+                    if not self._running:
+                        raise RuntimeError("keystream prefetch is stopped")
+                    if not waited:
+                        waited = True
+                        self.empty_waits += 1
+                    start = time.perf_counter()
+                    self._cond.notify_all()
+                    self._cond.wait()
+                    self.wait_seconds += time.perf_counter() - start
+                    continue
+                take = min(n, self._fill)
+                out.append(self._take(take))
+                self.consumed += take
+                n -= take
+                if self._fill <= self.low:
+                    self._cond.notify_all() # wake the thread up
+        return b''.join(out)
+
+    def stats(self):
+        with self._cond:
+            return {'depth': self.depth,
+                    'high': self.high,
+                    'low': self.low,
+                    'available': self._fill,
+                    'produced': self.produced,
+                    'consumed': self.consumed,
+                    'reads': self.reads,
+                    'empty_waits': self.empty_waits,
+                    'empty_rate': self.empty_waits / self.reads if self.reads else 0.0,
+                    'wait_seconds': self.wait_seconds}
+
+
+class RabbitContext:
+    '''The state of a key right after the key setup. New ciphers for that
+    key are made by copying it and setting the IV, the key schedule is
+    not run again.'''
+
+    def __init__(self, key):
+        master = Rabbit(key)
+        # never modified, reset() copies them
+        self.start_x = master.start_x
+        self.start_c = master.start_c
+        self.start_b = master.start_b
+
+    def cipher(self, iv = None):
+        '''A new Rabbit instance for this key and the given IV'''
+        cipher = Rabbit.__new__(Rabbit)
+        cipher.start_x = self.start_x
+        cipher.start_c = self.start_c
+        cipher.start_b = self.start_b
+        cipher.reset(iv)
+        return cipher
+
+    def size(self):
+        '''Approximate memory used, in bytes'''
+        return sys.getsizeof(self) + sys.getsizeof(self.start_x) + sys.getsizeof(self.start_c) + \
+               sum(sys.getsizeof(v) for v in self.start_x + self.start_c)
+
+
+class RabbitContextCache:
+    '''LRU cache of RabbitContext by key, bounded by a number of entries
+    and by the approximate memory of the contexts'''
+
+    def __init__(self, max_entries = CONTEXT_CACHE_ENTRIES, max_bytes = CONTEXT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._contexts = OrderedDict() # key -> (context, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def context(self, key):
+        with self._lock:
+            entry = self._contexts.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._contexts.move_to_end(key)
+                return entry[0]
+            self.misses += 1
+
+        context = RabbitContext(key) # key setup outside of the lock
+        size = context.size()
+        with self._lock:
+            if key not in self._contexts:
+                self._contexts[key] = (context, size)
+                self._bytes += size
+                while self._contexts and (len(self._contexts) > self.max_entries or
+                                          self._bytes > self.max_bytes):
+                    old_context, old_size = self._contexts.popitem(last = False)[1]
+                    self._bytes -= old_size
+                    self.evictions += 1
+        return context
+
+    def cipher(self, key, iv = None):
+        '''A new Rabbit instance, same as Rabbit(key, iv)'''
+        return self.context(key).cipher(iv)
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._contexts),
+                    'bytes': self._bytes,
+                    'max_entries': self.max_entries,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+# shared cache used by cipher()
+context_cache = RabbitContextCache()
+
+def cipher(key, iv = None):
+    '''Same as Rabbit(key, iv), but the key setup is cached'''
+    return context_cache.cipher(key, iv)
+
 #message="Hello"
 #key="qwerty"
 #iv=0
@@ -0,0 +1,177 @@
+from Rabbit import Rabbit
+
+# import that used for deriving the per-segment IVs
+import hashlib
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+# Segmented container format (all integers big endian)
+#
+#   header : magic "RSEG" | version | 3 pad bytes | segment size (uint32)
+#            | total plaintext size (uint64) | base IV (uint64)
+#            | number of segments (uint32)
+#   index  : for every segment, offset of its ciphertext from the start
+#            of the container (uint64) and its length (uint32)
+#   data   : the ciphertext of every segment, one after the other
+#
+# Every segment is encrypted with the same key but its own IV, derived
+# from the base IV and the segment number, so any segment can be
+# decrypted on its own and segments can be processed in parallel.
+
+MAGIC = b'RSEG'
+VERSION = 1
+HEADER = struct.Struct('>4sB3xIQQI')
+INDEX_ENTRY = struct.Struct('>QI')
+
+# default size of a segment
+SEGMENT_SIZE = 1 << 20
+
+_cipher = None # keyed Rabbit instance of a worker process
+
+
+def segment_iv(iv, index):
+    '''Derive the 64 bit IV of segment number index from the base IV'''
+    digest = hashlib.sha256(struct.pack('>QQ', iv, index)).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def _init_worker(key):
+    # the key setup is done once per process, every segment then
+    # only restores the master state with reset()
+    global _cipher
+    _cipher = Rabbit(key)
+
+
+def _crypt_segment(args):
+    iv, data = args
+    _cipher.reset(iv)
+    return _cipher.encrypt_bytes(data)
+
+
+def _crypt_file_segment(args):
+    # the worker reads its own segment so the data is not sent through a pipe
+    path, offset, length, iv = args
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        data = file.read(length)
+    _cipher.reset(iv)
+    return _cipher.encrypt_bytes(data)
+
+
+def _run(key, func, jobs, workers):
+    '''Yield func(job) for every job, in order. With more than one worker
+    the jobs are spread over a process pool, with at most 2 jobs per worker
+    in flight so the results waiting to be used stay bounded.'''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    jobs = iter(jobs)
+    if workers <= 1:
+        _init_worker(key)
+        for job in jobs:
+            yield func(job)
+        return
+
+    with ProcessPoolExecutor(workers, initializer = _init_worker, initargs = (key,)) as pool:
+        pending = []
+        for job in jobs:
+            pending.append(pool.submit(func, job))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def _header(total_size, iv, segment_size):
+    '''Build the header and index of a container'''
+    count = (total_size + segment_size - 1) // segment_size
+    parts = [HEADER.pack(MAGIC, VERSION, segment_size, total_size, iv, count)]
+    offset = HEADER.size + count * INDEX_ENTRY.size
+    for i in range(count):
+        length = min(segment_size, total_size - i * segment_size)
+        parts.append(INDEX_ENTRY.pack(offset, length))
+        offset += length
+    return b''.join(parts)
+
+
+def read_header(container):
+    '''Parse the header of a container (bytes-like object, or a binary file
+    object positioned at its start). Returns
+    (segment_size, total_size, iv, [(offset, length) for every segment])'''
+    if hasattr(container, 'read'):
+        head = container.read(HEADER.size)
+    else:
+        head = bytes(memoryview(container)[:HEADER.size])
+    if len(head) < HEADER.size:
+        raise ValueError("truncated segmented container")
+    magic, version, segment_size, total_size, iv, count = HEADER.unpack(head)
+    if magic != MAGIC:
+        raise ValueError("not a segmented Rabbit container")
+    if version != VERSION:
+        raise ValueError("unsupported container version %d" % version)
+
+    size = count * INDEX_ENTRY.size
+    if hasattr(container, 'read'):
+        raw = container.read(size)
+    else:
+        raw = bytes(memoryview(container)[HEADER.size:HEADER.size + size])
+    if len(raw) < size:
+        raise ValueError("truncated segmented container")
+    index = list(INDEX_ENTRY.iter_unpack(raw))
+    return segment_size, total_size, iv, index
+
+
+def encrypt_segments(key, data, iv = 0, segment_size = SEGMENT_SIZE, workers = None):
+    '''Encrypt a bytes-like object into a segmented container'''
+    data = memoryview(data).cast('B')
+    total = len(data)
+    jobs = ((segment_iv(iv, i), bytes(data[start:start + segment_size]))
+            for i, start in enumerate(range(0, total, segment_size)))
+    parts = [_header(total, iv, segment_size)]
+    parts.extend(_run(key, _crypt_segment, jobs, workers))
+    return b''.join(parts)
+
+
+def decrypt_segments(key, container, workers = None):
+    '''Decrypt a whole segmented container, returns the plaintext bytes'''
+    segment_size, total, iv, index = read_header(container)
+    view = memoryview(container).cast('B')
+    jobs = ((segment_iv(iv, i), bytes(view[offset:offset + length]))
+            for i, (offset, length) in enumerate(index))
+    return b''.join(_run(key, _crypt_segment, jobs, workers))
+
+
+def decrypt_segment(key, container, number):
+    '''Decrypt only segment number of a container (random access)'''
+    segment_size, total, iv, index = read_header(container)
+    if number not in range(len(index)):
+        raise ValueError("no segment %r in a container of %d segments" % (number, len(index)))
+    offset, length = index[number]
+    view = memoryview(container).cast('B')
+    cipher = Rabbit(key, segment_iv(iv, number))
+    return cipher.decrypt_bytes(view[offset:offset + length])
+
+
+def encrypt_file(key, in_path, out_path, iv = 0, segment_size = SEGMENT_SIZE, workers = None):
+    '''Encrypt a file into a segmented container file.
+    Returns the number of plaintext bytes.'''
+    total = os.path.getsize(in_path)
+    jobs = ((in_path, start, min(segment_size, total - start), segment_iv(iv, i))
+            for i, start in enumerate(range(0, total, segment_size)))
+    with open(out_path, 'wb') as dst:
+        dst.write(_header(total, iv, segment_size))
+        for segment in _run(key, _crypt_file_segment, jobs, workers):
+            dst.write(segment)
+    return total
+
+
+def decrypt_file(key, in_path, out_path, workers = None):
+    '''Decrypt a segmented container file. Returns the number of bytes.'''
+    with open(in_path, 'rb') as src:
+        segment_size, total, iv, index = read_header(src)
+    jobs = ((in_path, offset, length, segment_iv(iv, i))
+            for i, (offset, length) in enumerate(index))
+    with open(out_path, 'wb') as dst:
+        for segment in _run(key, _crypt_file_segment, jobs, workers):
+            dst.write(segment)
+    return total
@@ -0,0 +1,233 @@
+from NewECDSA import ECDSA, EllipticCurve
+from MHKS import MerkleHellmanKnapsack
+from Rabbit import Rabbit
+
+import asyncio
+import hashlib
+import os
+import secrets
+import struct
+import time
+
+# Asyncio sender/receiver for the Alice/Bob exchange of Main over TCP or
+# a Unix socket. A transfer is a sequence of frames, every frame is
+# type (1 byte) | payload length (uint32, big endian) | payload:
+#
+#   KEY   : the Rabbit session key wrapped with the receiver's MHKS public key
+#   PUB   : the sender's ECDSA public key, x and y on 24 bytes each
+#   DATA  : a chunk of Rabbit ciphertext (any number of DATA frames)
+#   END   : the ECDSA signature of the plaintext, r and s on 24 bytes each
+#
+# and the receiver answers with one byte (1 = verified, 0 = rejected)
+# followed by the number of plaintext bytes (uint64).
+#
+# The crypto work runs in an executor so the event loop keeps serving
+# other connections. Any concurrent.futures executor can be given, the
+# cipher state travels with every chunk so a ProcessPoolExecutor works too.
+
+KEY, PUB, DATA, END = b'K', b'P', b'D', b'E'
+FRAME = struct.Struct('>cI')
+REPLY = struct.Struct('>BQ')
+COORD_BYTES = 24 # secp192k1 coordinates and signature values
+
+CHUNK_SIZE = 1 << 16
+MAX_FRAME = 1 << 24 # bigger frames are refused
+
+
+def _crypt_chunk(cipher, data):
+    # runs in the executor, returns the cipher so its state is kept
+    # when the executor is another process
+    return cipher, cipher.encrypt_bytes(data)
+
+
+class TransferStats:
+    def __init__(self, path = None):
+        self.path = path
+        self.bytes = 0
+        self.chunks = 0
+        self.start = time.perf_counter()
+        self.end = None
+        self.verified = None
+        self.error = None # why the transfer failed, if it did
+
+    def finish(self, verified, error = None):
+        self.end = time.perf_counter()
+        self.verified = verified
+        self.error = error
+
+    def as_dict(self):
+        elapsed = (self.end or time.perf_counter()) - self.start
+        return {'path': self.path,
+                'bytes': self.bytes,
+                'chunks': self.chunks,
+                'seconds': elapsed,
+                'mb_per_s': self.bytes / (1 << 20) / elapsed if elapsed else 0.0,
+                'verified': self.verified,
+                'error': self.error}
+
+
+async def _write_frame(writer, kind, payload):
+    writer.write(FRAME.pack(kind, len(payload)))
+    writer.write(payload)
+    # backpressure: wait while the transport buffer is above its high water mark
+    await writer.drain()
+
+
+async def _read_frame(reader):
+    kind, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if length > MAX_FRAME:
+        raise ValueError("frame of %d bytes is too big" % length)
+    return kind, await reader.readexactly(length)
+
+
+class TransferReceiver:
+    '''Bob's side: accepts transfers, writes the plaintext of every
+    transfer to output_dir and verifies the signature.
+    trusted_keys are the ECDSA public keys of the accepted senders, the
+    public key of the PUB frame is only used when it is one of them
+    (otherwise anyone could sign with a fresh key and be "verified").'''
+
+    def __init__(self, mhks, output_dir, trusted_keys, curve = None, executor = None):
+        self.mhks = mhks # holds the receiver's MHKS keys
+        self.curve = curve or EllipticCurve()
+        self.ecdsa = ECDSA(self.curve)
+        self.output_dir = output_dir
+        self.executor = executor
+        self.trusted_keys = set(trusted_keys)
+        if not self.trusted_keys:
+            raise ValueError("at least one trusted sender key is needed")
+        self.results = [] # stats of every finished transfer
+        self.active = 0
+        self._count = 0
+
+    async def start_tcp(self, host = '127.0.0.1', port = 0):
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def start_unix(self, path):
+        return await asyncio.start_unix_server(self._handle, path)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self._count += 1
+        self.active += 1
+        path = os.path.join(self.output_dir, 'transfer-%d.bin' % self._count)
+        # the plaintext is written next to path and only moved there once
+        # the signature is verified
+        tmp = path + '.tmp'
+        stats = TransferStats(path)
+        delivered = False # verified and moved to path
+        error = None
+        try:
+            kind, payload = await _read_frame(reader)
+            if kind != KEY:
+                raise ValueError("expected the key frame")
+            wrapped = int.from_bytes(payload, 'big')
+            key = await loop.run_in_executor(self.executor, self.mhks.decrypt, wrapped, self.mhks.private_key)
+
+            kind, payload = await _read_frame(reader)
+            if kind != PUB or len(payload) != 2 * COORD_BYTES:
+                raise ValueError("expected the public key frame")
+            public_key = (int.from_bytes(payload[:COORD_BYTES], 'big'),
+                          int.from_bytes(payload[COORD_BYTES:], 'big'))
+            if public_key not in self.trusted_keys:
+                raise ValueError("unknown sender")
+
+            cipher = Rabbit(key, 0)
+            hash_obj = hashlib.sha256()
+            with open(tmp, 'wb') as file:
+                while True:
+                    # the next frame is only read once this one is handled,
+                    # so a fast sender is slowed down by TCP flow control
+                    kind, payload = await _read_frame(reader)
+                    if kind != DATA:
+                        break
+                    cipher, plaintext = await loop.run_in_executor(self.executor, _crypt_chunk, cipher, payload)
+                    await loop.run_in_executor(None, hash_obj.update, plaintext)
+                    await loop.run_in_executor(None, file.write, plaintext)
+                    stats.bytes += len(plaintext)
+                    stats.chunks += 1
+            if kind != END or len(payload) != 2 * COORD_BYTES:
+                raise ValueError("expected the signature frame")
+            signature = (int.from_bytes(payload[:COORD_BYTES], 'big'),
+                         int.from_bytes(payload[COORD_BYTES:], 'big'))
+            verified = await loop.run_in_executor(self.executor, self.ecdsa.verify_digest,
+                                                  public_key, hash_obj.digest(), signature)
+            if verified:
+                os.replace(tmp, path)
+                delivered = True
+            writer.write(REPLY.pack(1 if verified else 0, stats.bytes))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, OSError, ValueError) as exc:
+            # OSError also covers the output file (and ConnectionError)
+            error = repr(exc)
+        finally:
+            if not delivered:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            stats.finish(delivered, error)
+            self.results.append(stats)
+            self.active -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def stats(self):
+        return {'active': self.active,
+                'finished': len(self.results),
+                'bytes': sum(s.bytes for s in self.results),
+                'transfers': [s.as_dict() for s in self.results]}
+
+
+async def send_file(path, recipient_key, ecdsa, private_key, public_key,
+                    host = '127.0.0.1', port = None, unix_path = None,
+                    rabbit_key = None, chunk_size = CHUNK_SIZE, executor = None):
+    '''Alice's side: sends the file at path to a TransferReceiver.
+    recipient_key is the receiver's MHKS public key, private_key/public_key
+    the sender's ECDSA keys. A random session key is used when rabbit_key
+    is not given. Returns the transfer stats as a dict. Raises
+    ConnectionError when the receiver drops the transfer (e.g. the
+    sender is not one of its trusted keys).'''
+    loop = asyncio.get_running_loop()
+    if rabbit_key is None:
+        rabbit_key = secrets.randbits(128)
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    stats = TransferStats(path)
+    try:
+        wrapped = await loop.run_in_executor(executor, MerkleHellmanKnapsack().encrypt, rabbit_key, recipient_key)
+        await _write_frame(writer, KEY, wrapped.to_bytes((wrapped.bit_length() + 7) // 8, 'big'))
+        await _write_frame(writer, PUB, public_key[0].to_bytes(COORD_BYTES, 'big') +
+                                        public_key[1].to_bytes(COORD_BYTES, 'big'))
+
+        cipher = Rabbit(rabbit_key, 0)
+        hash_obj = hashlib.sha256()
+        with open(path, 'rb') as file:
+            while True:
+                chunk = await loop.run_in_executor(None, file.read, chunk_size)
+                if not chunk:
+                    break
+                await loop.run_in_executor(None, hash_obj.update, chunk)
+                cipher, encrypted = await loop.run_in_executor(executor, _crypt_chunk, cipher, chunk)
+                await _write_frame(writer, DATA, encrypted)
+                stats.bytes += len(chunk)
+                stats.chunks += 1
+
+        r, s = await loop.run_in_executor(executor, ecdsa.sign_digest, private_key, hash_obj.digest())
+        await _write_frame(writer, END, r.to_bytes(COORD_BYTES, 'big') + s.to_bytes(COORD_BYTES, 'big'))
+
+        status, size = REPLY.unpack(await reader.readexactly(REPLY.size))
+        stats.finish(status == 1 and size == stats.bytes)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    return stats.as_dict()
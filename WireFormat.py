@@ -0,0 +1,228 @@
+import hashlib
+import struct
+
+# Binary envelope carrying one transfer (all integers big endian):
+#
+#   magic "CPEV" | version (1 byte) | MHKS ciphertext length (uint16)
+#   | MHKS ciphertext (the wrapped Rabbit key, minimal big endian bytes)
+#   | r (24 bytes) | s (24 bytes)
+#   | sender's ECDSA public key, compressed (25 bytes: 0x02/0x03 + x)
+#   | payload length (uint64) | payload (the raw Rabbit ciphertext)
+#
+# The multi-recipient envelope carries the same payload for many receivers,
+# with the Rabbit key wrapped once for each of them:
+#
+#   magic "CPMR" | version (1 byte) | number of recipients (uint32)
+#   | for every recipient: fingerprint of its MHKS public key (8 bytes)
+#     | MHKS ciphertext length (uint16) | MHKS ciphertext
+#   | r | s | public key | payload length | payload   (as above)
+#
+# parse_envelope/parse_multi_envelope do not copy anything, they return
+# memoryview slices of the buffer they are given (bytes, bytearray, mmap...).
+
+MAGIC = b'CPEV'
+MULTI_MAGIC = b'CPMR'
+VERSION = 1
+HEAD = struct.Struct('>4sBH')
+MULTI_HEAD = struct.Struct('>4sBI')
+RECIPIENT = struct.Struct('>8sH')
+LENGTH = struct.Struct('>Q')
+COORD_BYTES = 24 # secp192k1 coordinates and signature values
+POINT_BYTES = COORD_BYTES + 1
+# r, s, public key and payload length, the end of every header
+TRAILER_BYTES = 2 * COORD_BYTES + POINT_BYTES + LENGTH.size
+
+
+def int_to_bytes(n):
+    '''Minimal big endian encoding of a non negative int (0 -> b"")'''
+    return n.to_bytes((n.bit_length() + 7) // 8, 'big')
+
+
+def compress_point(P):
+    '''0x02 or 0x03 (parity of y) followed by x on 24 bytes'''
+    x, y = P
+    return bytes((2 + (y & 1),)) + x.to_bytes(COORD_BYTES, 'big')
+
+
+def decompress_point(data, curve):
+    '''Inverse of compress_point, y is recomputed from y^2 = x^3 + ax + b'''
+    data = bytes(data)
+    if len(data) != POINT_BYTES or data[0] not in (2, 3):
+        raise ValueError("invalid compressed point")
+    x = int.from_bytes(data[1:], 'big')
+    p = curve.p
+    if x >= p:
+        raise ValueError("invalid compressed point")
+    rhs = (x * x * x + curve.a * x + curve.b) % p
+    # p = 3 mod 4 so the square root is rhs^((p + 1) / 4)
+    y = pow(rhs, (p + 1) // 4, p)
+    if y * y % p != rhs:
+        raise ValueError("point is not on the curve")
+    if (y & 1) != data[0] - 2:
+        y = p - y
+    return x, y
+
+
+def key_fingerprint(public_key):
+    '''8 byte identifier of an MHKS public key (list of ints)'''
+    digest = hashlib.sha256(','.join('%x' % element for element in public_key).encode())
+    return digest.digest()[:8]
+
+
+def _trailer(signature, public_key, payload_length):
+    r, s = signature
+    return b''.join((r.to_bytes(COORD_BYTES, 'big'), s.to_bytes(COORD_BYTES, 'big'),
+                     compress_point(public_key), LENGTH.pack(payload_length)))
+
+
+def encode_header(wrapped_key, signature, public_key, payload_length):
+    '''Everything before the payload, so the payload can be streamed after it'''
+    key = int_to_bytes(wrapped_key)
+    if len(key) > 0xFFFF:
+        raise ValueError("wrapped key is too long")
+    return b''.join((HEAD.pack(MAGIC, VERSION, len(key)), key,
+                     _trailer(signature, public_key, payload_length)))
+
+
+def encode_multi_header(recipients, signature, public_key, payload_length):
+    '''Header of a multi-recipient envelope, recipients is a list of
+    (fingerprint, wrapped key). The signature starts TRAILER_BYTES before
+    the end of the header.'''
+    parts = [MULTI_HEAD.pack(MULTI_MAGIC, VERSION, len(recipients))]
+    for fingerprint, wrapped_key in recipients:
+        key = int_to_bytes(wrapped_key)
+        if len(key) > 0xFFFF:
+            raise ValueError("wrapped key is too long")
+        parts.append(RECIPIENT.pack(fingerprint, len(key)))
+        parts.append(key)
+    parts.append(_trailer(signature, public_key, payload_length))
+    return b''.join(parts)
+
+
+def signature_offset(wrapped_key):
+    '''Offset of r in an envelope, used to write the signature after the
+    payload when it is only known at the end'''
+    return HEAD.size + len(int_to_bytes(wrapped_key))
+
+
+def encode_envelope(wrapped_key, signature, public_key, payload):
+    return encode_header(wrapped_key, signature, public_key, len(payload)) + bytes(payload)
+
+
+class Envelope:
+    '''Parsed envelope, every field is a memoryview of the original buffer'''
+
+    def __init__(self, wrapped_key, r, s, public_key, payload):
+        self.wrapped_key = wrapped_key
+        self.r = r
+        self.s = s
+        self.public_key = public_key
+        self.payload = payload
+
+    def wrapped_key_int(self):
+        return int.from_bytes(self.wrapped_key, 'big')
+
+    def signature(self):
+        return int.from_bytes(self.r, 'big'), int.from_bytes(self.s, 'big')
+
+    def public_key_point(self, curve):
+        return decompress_point(self.public_key, curve)
+
+    def release(self):
+        # memoryviews keep an mmap from being closed
+        for view in (self.wrapped_key, self.r, self.s, self.public_key, self.payload):
+            view.release()
+
+
+class MultiEnvelope(Envelope):
+    '''Parsed multi-recipient envelope, recipients maps every fingerprint
+    to the memoryview of its wrapped key'''
+
+    def __init__(self, recipients, r, s, public_key, payload):
+        Envelope.__init__(self, None, r, s, public_key, payload)
+        self.recipients = recipients
+
+    def wrapped_key_for(self, mhks_public_key):
+        '''The wrapped key of the recipient with this MHKS public key'''
+        view = self.recipients.get(key_fingerprint(mhks_public_key))
+        if view is None:
+            raise KeyError("not a recipient of this envelope")
+        return int.from_bytes(view, 'big')
+
+    def release(self):
+        for view in self.recipients.values():
+            view.release()
+        for view in (self.r, self.s, self.public_key, self.payload):
+            view.release()
+
+
+def _parse_trailer(view, offset):
+    # offsets of r, s, public key and payload; checks everything before
+    # any slice is taken, so nothing is left exported on errors
+    if len(view) < offset + TRAILER_BYTES:
+        raise ValueError("truncated envelope")
+    payload_length, = LENGTH.unpack_from(view, offset + TRAILER_BYTES - LENGTH.size)
+    end = offset + TRAILER_BYTES + payload_length
+    if len(view) < end:
+        raise ValueError("truncated envelope")
+    bounds = []
+    for size in (COORD_BYTES, COORD_BYTES, POINT_BYTES):
+        bounds.append((offset, offset + size))
+        offset += size
+    bounds.append((end - payload_length, end))
+    return bounds
+
+
+def _multi_bounds(view):
+    if len(view) < MULTI_HEAD.size:
+        raise ValueError("truncated envelope")
+    magic, version, count = MULTI_HEAD.unpack_from(view)
+    if magic != MULTI_MAGIC:
+        raise ValueError("not a multi-recipient envelope")
+    if version != VERSION:
+        raise ValueError("unsupported envelope version %d" % version)
+
+    offset = MULTI_HEAD.size
+    recipients = []
+    for i in range(count):
+        if len(view) < offset + RECIPIENT.size:
+            raise ValueError("truncated envelope")
+        fingerprint, key_length = RECIPIENT.unpack_from(view, offset)
+        offset += RECIPIENT.size
+        recipients.append((fingerprint, offset, offset + key_length))
+        offset += key_length
+    return recipients, _parse_trailer(view, offset)
+
+
+def parse_multi_envelope(buffer):
+    view = memoryview(buffer).cast('B')
+    try:
+        recipients, bounds = _multi_bounds(view)
+    except BaseException:
+        view.release()
+        raise
+    return MultiEnvelope({fingerprint: view[start:end] for fingerprint, start, end in recipients},
+                         *[view[start:end] for start, end in bounds])
+
+
+def _bounds(view):
+    if len(view) < HEAD.size:
+        raise ValueError("truncated envelope")
+    magic, version, key_length = HEAD.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("not an envelope")
+    if version != VERSION:
+        raise ValueError("unsupported envelope version %d" % version)
+
+    offset = HEAD.size
+    return [(offset, offset + key_length)] + _parse_trailer(view, offset + key_length)
+
+
+def parse_envelope(buffer):
+    view = memoryview(buffer).cast('B')
+    try:
+        bounds = _bounds(view)
+    except BaseException:
+        view.release()
+        raise
+    return Envelope(*[view[start:end] for start, end in bounds])
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import Main
+import Pipeline
+
+# batch mode of Main, with one worker so everything runs in this process
+
+
+@pytest.fixture
+def tree(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents = True)
+    (source / 'a.bin').write_bytes(os.urandom(3000))
+    (source / 'sub' / 'b.bin').write_bytes(os.urandom(100))
+    (source / 'empty.bin').write_bytes(b'')
+    return str(source), str(tmp_path / 'keys.json'), tmp_path
+
+
+def run(command, source, destination, keys):
+    return Main.run_batch(command, source, destination, keys, workers = 1)
+
+
+def test_encrypt_decrypt_and_skip(tree):
+    source, keys, tmp_path = tree
+    encrypted, decrypted = str(tmp_path / 'enc'), str(tmp_path / 'dec')
+    report = run('encrypt', source, encrypted, keys)
+    assert (report['files'], report['failed']) == (3, 0)
+    report = run('decrypt', encrypted, decrypted, keys)
+    assert (report['files'], report['failed']) == (3, 0)
+    for rel in ('a.bin', os.path.join('sub', 'b.bin'), 'empty.bin'):
+        with open(os.path.join(source, rel), 'rb') as a, open(os.path.join(decrypted, rel), 'rb') as b:
+            assert a.read() == b.read()
+    assert run('encrypt', source, encrypted, keys)['skipped'] == 3
+
+    # a destination changed since the last run is done again
+    os.remove(os.path.join(encrypted, 'a.bin.enc'))
+    report = run('encrypt', source, encrypted, keys)
+    assert (report['files'], report['skipped']) == (1, 2)
+
+
+def test_tampered_signature_is_not_skipped(tree):
+    source, keys, tmp_path = tree
+    signatures = str(tmp_path / 'sig')
+    assert run('sign', source, signatures, keys)['failed'] == 0
+    report = run('verify', source, signatures, keys)
+    assert (report['files'], report['failed']) == (3, 0)
+    assert run('verify', source, signatures, keys)['skipped'] == 3
+
+    path = os.path.join(signatures, 'a.bin.sig')
+    with open(path, 'rb') as file:
+        data = bytearray(file.read())
+    data[5] ^= 1
+    with open(path, 'wb') as file:
+        file.write(data)
+    report = run('verify', source, signatures, keys)
+    assert (report['files'], report['skipped'], report['failed']) == (1, 2, 1)
+
+
+def test_failed_encrypt_leaves_nothing(tree, monkeypatch):
+    source, keys, tmp_path = tree
+    encrypted = str(tmp_path / 'enc')
+
+    def failing(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(Pipeline, 'encrypt_and_sign', failing)
+    report = run('encrypt', source, encrypted, keys)
+    assert report['failed'] == 3
+    left = [name for root, dirs, files in os.walk(encrypted) for name in files if not name.startswith('.manifest-')]
+    assert left == []
+
+
+def test_vanished_source_is_a_failure(tree):
+    source, keys, tmp_path = tree
+    Main._init_batch(keys, 'alice', 'bob')
+    src, size, seconds, ok, error = Main._batch_job('encrypt', os.path.join(source, 'missing'),
+                                                    str(tmp_path / 'enc' / 'missing.enc'))
+    assert not ok and error
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import Field
+from NewECDSA import EllipticCurve
+
+# The same curve operations under both big integer backends, every
+# backend runs in its own interpreter (it is chosen at import)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import json, random
+import Field
+from NewECDSA import ECDSA, EllipticCurve
+rng = random.Random(21)
+curve = EllipticCurve()
+n = curve.order
+G = curve.generator()
+P = curve.multiply_jacobian(G, rng.randrange(1, n))
+scalars = [1, 2, n - 1] + [rng.randrange(1, n) for i in range(5)]
+ecdsa = ECDSA(curve)
+private_key = rng.randrange(1, n)
+public_key = curve.multiply_generator(private_key)
+print(json.dumps({
+    'backend': Field.BACKEND,
+    'types': sorted({type(c).__name__ for Q in [curve.multiply_generator(3)] for c in Q}),
+    'inverses': [curve.mod_inverse(k, n) for k in scalars] + [curve.mod_inverse(k, curve.p) for k in scalars],
+    'jacobian': [curve.multiply_jacobian(P, k) for k in scalars],
+    'generator': [curve.multiply_generator(k) for k in scalars],
+    'glv': [curve.multiply_glv(P, k) for k in scalars],
+    'joint': [curve.joint_multiply(k, G, k + 1, P) for k in scalars],
+    'batch': curve.batch_from_jacobian([curve.jacobian_double(curve.to_jacobian(P))]),
+    'verify': ecdsa.verify_batch([(public_key, 'm', ecdsa.sign(private_key, 'm')),
+                                  (public_key, 'x', ecdsa.sign(private_key, 'm'))]),
+}))
+'''
+
+
+def run(backend):
+    env = dict(os.environ, CRYPTO_BIGINT_BACKEND = backend, PYTHONPATH = ROOT)
+    output = subprocess.run([sys.executable, '-c', SCRIPT], env = env, cwd = ROOT,
+                            capture_output = True, text = True, check = True).stdout
+    return json.loads(output)
+
+
+def test_python_backend():
+    result = run('python')
+    assert result['backend'] == 'python'
+    assert result['types'] == ['int']
+    assert result['verify'] == [True, False]
+
+
+def test_backends_agree():
+    pytest.importorskip('gmpy2')
+    python, gmp = run('python'), run('gmpy2')
+    assert gmp['backend'] == 'gmpy2'
+    # affine results are converted back to int by both
+    assert gmp['types'] == ['int']
+    python.pop('backend')
+    gmp.pop('backend')
+    assert gmp == python
+
+
+def test_inverse():
+    curve = EllipticCurve()
+    for m in (curve.p, curve.order):
+        for a in (1, 2, m - 1, 12345678901234567890, -5):
+            assert curve.mod_inverse(a, m) * a % m == 1
+        with pytest.raises(ZeroDivisionError):
+            curve.mod_inverse(0, m)
+        with pytest.raises(ZeroDivisionError):
+            curve.mod_inverse(m, m)
+    assert int(Field.inverse(3, 7)) == 5
+    with pytest.raises(ZeroDivisionError):
+        Field.inverse(6, 9)
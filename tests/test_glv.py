@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from NewECDSA import ECDSA, EllipticCurve
+
+# GLV path (glv_split, multiply_glv, joint_multiply_jacobian) against
+# the affine multiply()
+
+curve = EllipticCurve()
+G = curve.generator()
+n = curve.order
+beta, lam, basis = curve.glv_constants()
+rng = random.Random(22)
+
+EDGE_SCALARS = [0, 1, 2, lam, lam + 1, n - lam, n - 1, n, n + 1, 2**96, 2**96 - 1,
+                2**96 + 1, (n - 1) // 2, 2 * n + 5, 2**192]
+RANDOM_SCALARS = [rng.randrange(1, n) for i in range(20)]
+P = curve.multiply(G, rng.randrange(2, n))
+
+
+def test_constants():
+    assert beta != 1 and pow(beta, 3, curve.p) == 1
+    assert lam != 1 and pow(lam, 3, n) == 1
+    assert curve.multiply(G, lam) == curve.endomorphism(G)
+    for a, b in basis:
+        assert (a + b * lam) % n == 0
+
+
+@pytest.mark.parametrize('k', EDGE_SCALARS + RANDOM_SCALARS + [rng.randrange(n, 2**200) for i in range(5)])
+def test_glv_split(k):
+    k1, k2 = curve.glv_split(k)
+    assert abs(k1) < 2**96 and abs(k2) < 2**96
+    assert (k1 + k2 * lam - k) % n == 0
+
+
+@pytest.mark.parametrize('k', EDGE_SCALARS + RANDOM_SCALARS)
+@pytest.mark.parametrize('point', [G, P], ids = ['G', 'P'])
+def test_multiply_glv_matches_affine(point, k):
+    assert curve.multiply_glv(point, k) == curve.multiply(point, k)
+
+
+@pytest.mark.parametrize('k', EDGE_SCALARS + RANDOM_SCALARS[:5])
+def test_joint_multiply_matches_affine(k):
+    u = rng.randrange(n)
+    expected = curve.add(curve.multiply(G, k), curve.multiply(P, u))
+    assert curve.joint_multiply(k, G, u, P) == expected
+    assert curve.joint_multiply(u, P, k, G) == expected
+
+
+def test_joint_multiply_without_glv():
+    plain = EllipticCurve()
+    plain.glv = False
+    for i in range(5):
+        u1, u2 = rng.randrange(n), rng.randrange(n)
+        assert plain.joint_multiply(u1, G, u2, P) == curve.joint_multiply(u1, G, u2, P)
+
+
+def test_sign_verify():
+    ecdsa = ECDSA(curve)
+    private_key, public_key = ecdsa.generate_key_pair()
+    assert public_key == curve.multiply(G, private_key)
+    signature = ecdsa.sign(private_key, 'message')
+    assert ecdsa.verify(public_key, 'message', signature)
+    assert not ecdsa.verify(public_key, 'other message', signature)
+    items = [(public_key, 'message', signature), (public_key, 'other message', signature)]
+    assert ecdsa.verify_batch(items) == [True, False]
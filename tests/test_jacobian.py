@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from NewECDSA import EllipticCurve
+
+# multiply_jacobian against the affine double and add of multiply()
+
+curve = EllipticCurve()
+G = curve.generator()
+n = curve.order
+rng = random.Random(4)
+
+EDGE_SCALARS = [0, 1, 2, n - 1, n, n + 1]
+RANDOM_SCALARS = [rng.randrange(1, n) for i in range(20)]
+# a point other than G, so the tables of G are not involved
+P = curve.multiply(G, rng.randrange(2, n))
+
+
+@pytest.mark.parametrize('k', EDGE_SCALARS + RANDOM_SCALARS)
+@pytest.mark.parametrize('point', [G, P], ids = ['G', 'P'])
+def test_multiply_jacobian_matches_affine(point, k):
+    assert curve.multiply_jacobian(point, k) == curve.multiply(point, k)
+
+
+def test_edge_results():
+    assert curve.multiply_jacobian(G, 0) is None
+    assert curve.multiply_jacobian(G, n) is None
+    assert curve.multiply_jacobian(G, 1) == G
+    assert curve.multiply_jacobian(G, n + 1) == G
+    assert curve.multiply_jacobian(G, n - 1) == curve.negate(G)
+
+
+def test_jacobian_round_trip():
+    J = curve.to_jacobian(P)
+    assert curve.from_jacobian(J) == P
+    assert curve.from_jacobian(curve.jacobian_double(J)) == curve.add(P, P)
+    assert curve.from_jacobian(curve.jacobian_add(J, curve.to_jacobian(G))) == curve.add(P, G)
+    assert curve.from_jacobian(curve.jacobian_add_affine(J, G)) == curve.add(P, G)
+    assert curve.jacobian_add_affine(J, curve.negate(P)) is None
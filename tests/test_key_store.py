@@ -0,0 +1,39 @@
+import os
+import stat
+
+import pytest
+
+from KeyStore import KeyStore
+from MHKS import MerkleHellmanKnapsack
+from NewECDSA import EllipticCurve
+
+# keys saved by KeyStore come back the same, the file stays private
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'keys.json')
+    curve = EllipticCurve()
+    mhks = MerkleHellmanKnapsack()
+    store = KeyStore(path)
+    store.save_mhks('bob', mhks)
+    store.save_ecdsa('alice', 12345)
+
+    store = KeyStore(path)
+    loaded = store.load_mhks('bob')
+    assert loaded.private_key == mhks.private_key
+    assert loaded.public_key == mhks.public_key
+    assert store.load_ecdsa('alice', curve) == (12345, curve.multiply_generator(12345))
+    assert store.load_mhks('alice') is None
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(str(tmp_path)) == ['keys.json']
+
+
+def test_failed_save_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / 'keys.json')
+    store = KeyStore(path)
+    store.save_ecdsa('alice', 1)
+    store._person('bob')['ecdsa'] = {'private_key': object()} # not JSON serializable
+    with pytest.raises(TypeError):
+        store._save()
+    assert os.listdir(str(tmp_path)) == ['keys.json']
+    assert KeyStore(path).load_ecdsa('alice', EllipticCurve())[0] == 1
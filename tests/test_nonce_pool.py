@@ -0,0 +1,73 @@
+import os
+import pickle
+import threading
+import time
+
+from NewECDSA import ECDSA, EllipticCurve
+
+# nonce pool and the generator table shared with its thread
+
+
+def test_pool_with_table_path(tmp_path):
+    path = str(tmp_path / 'table.json')
+    ecdsa = ECDSA(EllipticCurve(table_path = path))
+    pool = ecdsa.enable_nonce_pool(4)
+    try:
+        private_key, public_key = ecdsa.generate_key_pair()
+        for i in range(10):
+            signature = ecdsa.sign(private_key, 'message %d' % i)
+            assert ecdsa.verify(public_key, 'message %d' % i, signature)
+        deadline = time.time() + 5
+        while pool.stats()['produced'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        stats = pool.stats()
+        assert stats['produced'] > 0
+        assert stats['errors'] == 0
+    finally:
+        ecdsa.disable_nonce_pool()
+    assert os.listdir(str(tmp_path)) == ['table.json']
+
+
+def test_table_built_once_by_concurrent_threads(tmp_path):
+    path = str(tmp_path / 'table.json')
+    curves = [EllipticCurve(table_path = path) for i in range(4)]
+    threads = [threading.Thread(target = curve.generator_table) for curve in curves]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(curve.generator_table() == curves[0].generator_table() for curve in curves)
+    assert os.listdir(str(tmp_path)) == ['table.json']
+
+
+def test_refill_errors_are_recorded():
+    ecdsa = ECDSA(EllipticCurve())
+    precompute = ecdsa._precompute_nonce
+    calls = []
+
+    def failing():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError('boom')
+        return precompute()
+
+    ecdsa._precompute_nonce = failing
+    pool = ecdsa.enable_nonce_pool(2)
+    try:
+        deadline = time.time() + 5
+        while pool.stats()['produced'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        stats = pool.stats()
+    finally:
+        ecdsa.disable_nonce_pool()
+    assert stats['errors'] == 2
+    assert 'boom' in stats['last_error']
+    assert stats['produced'] > 0
+
+
+def test_pickle_keeps_working():
+    ecdsa = ECDSA(EllipticCurve())
+    ecdsa.curve.generator_table()
+    private_key, public_key = ecdsa.generate_key_pair()
+    copy = pickle.loads(pickle.dumps(ecdsa))
+    assert copy.verify(public_key, 'm', ecdsa.sign(private_key, 'm'))
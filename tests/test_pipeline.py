@@ -0,0 +1,91 @@
+import errno
+import hashlib
+import io
+import mmap
+import os
+
+import pytest
+
+import Main
+import Pipeline
+import WireFormat
+from NewECDSA import ECDSA, EllipticCurve
+from Rabbit import Rabbit
+
+# single-pass encrypt-and-sign / decrypt-and-verify
+
+KEY = 0x0123456789abcdef0123456789abcdef
+CHUNK = 1000
+DATA = os.urandom(5 * CHUNK + 17)
+
+curve = EllipticCurve()
+ecdsa = ECDSA(curve)
+PRIVATE_KEY, PUBLIC_KEY = ecdsa.generate_key_pair()
+
+
+class FailingWriter(io.BytesIO):
+    # a destination that runs out of space on the second write
+    def __init__(self):
+        io.BytesIO.__init__(self)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        if self.writes == 2:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        return io.BytesIO.write(self, data)
+
+
+def encrypted():
+    dst = io.BytesIO()
+    signature, total = Pipeline.encrypt_and_sign(Rabbit(KEY, 0), ecdsa, PRIVATE_KEY, io.BytesIO(DATA), dst, CHUNK)
+    return signature, total, dst.getvalue()
+
+
+def test_round_trip():
+    signature, total, ciphertext = encrypted()
+    assert total == len(DATA)
+    assert ciphertext == Rabbit(KEY, 0).encrypt_bytes(DATA)
+    assert ecdsa.verify_digest(PUBLIC_KEY, hashlib.sha256(DATA).digest(), signature)
+    for src in (io.BytesIO(ciphertext), ciphertext):
+        dst = io.BytesIO()
+        assert Pipeline.decrypt_and_verify(Rabbit(KEY, 0), ecdsa, PUBLIC_KEY, signature, src, dst, CHUNK) == (True, len(DATA))
+        assert dst.getvalue() == DATA
+    tampered = bytearray(ciphertext)
+    tampered[3] ^= 1
+    result, size = Pipeline.decrypt_and_verify(Rabbit(KEY, 0), ecdsa, PUBLIC_KEY, signature, tampered, io.BytesIO(), CHUNK)
+    assert not result
+
+
+def test_failing_destination_keeps_the_error(tmp_path):
+    signature, total, ciphertext = encrypted()
+    path = tmp_path / 'payload'
+    path.write_bytes(ciphertext)
+    # the OSError must come out of the mmap with block, not a BufferError
+    with pytest.raises(OSError) as info:
+        with open(str(path), 'rb') as file, \
+             mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            Pipeline.decrypt_and_verify(Rabbit(KEY, 0), ecdsa, PUBLIC_KEY, signature, data, FailingWriter(), CHUNK)
+    assert info.value.errno == errno.ENOSPC
+
+
+def test_failing_destination_through_an_envelope(tmp_path, monkeypatch):
+    signature, total, ciphertext = encrypted()
+    path = str(tmp_path / 'file.enc')
+    with open(path, 'wb') as file:
+        file.write(WireFormat.encode_envelope(1, signature, PUBLIC_KEY, ciphertext))
+
+    class Receiver:
+        privateMHKSKey = None
+        def decryptRabbitKey(self, wrapped, private_key):
+            return KEY
+
+    real_open = open
+    def failing_open(name, mode = 'r', *args, **kwargs):
+        if 'w' in mode:
+            return FailingWriter()
+        return real_open(name, mode, *args, **kwargs)
+    monkeypatch.setattr(Main, 'open', failing_open, raising = False)
+    with pytest.raises(OSError) as info:
+        Main.read_signed_envelope(Receiver(), PUBLIC_KEY, ecdsa, path, str(tmp_path / 'out'), chunk_size = CHUNK)
+    assert info.value.errno == errno.ENOSPC
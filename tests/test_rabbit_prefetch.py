@@ -0,0 +1,53 @@
+import os
+import random
+
+import pytest
+
+from Rabbit import Rabbit
+
+# keystream of a prefetching cipher against the plain bytes API
+
+KEY = 0x0123456789abcdef0123456789abcdef
+
+
+def test_same_output_as_without_prefetch():
+    rng = random.Random(23)
+    data = os.urandom(100000)
+    expected = Rabbit(KEY, 7).encrypt_bytes(data)
+    cipher = Rabbit(KEY, 7)
+    out = [cipher.encrypt_bytes(data[:5])]
+    cipher.enable_prefetch(256, 200, 50)
+    position = 5
+    while position < len(data):
+        size = min(rng.choice([1, 15, 16, 17, 300, 5000]), len(data) - position)
+        out.append(cipher.encrypt_bytes(data[position:position + size]))
+        position += size
+        if rng.random() < 0.1:
+            cipher.disable_prefetch()
+        elif rng.random() < 0.1:
+            cipher.enable_prefetch(256, 200, 50)
+    cipher.disable_prefetch()
+    assert b''.join(out) == expected
+
+
+@pytest.mark.parametrize('args', [(8,), (64, 32, 40), (64, 80), (64, 10, 10)])
+def test_invalid_arguments_keep_the_stream(args):
+    expected = Rabbit(KEY, 7).keystream_bytes(100)
+    cipher = Rabbit(KEY, 7)
+    first = cipher.keystream_bytes(5)
+    with pytest.raises(ValueError):
+        cipher.enable_prefetch(*args)
+    assert cipher.prefetch is None
+    assert first + cipher.keystream_bytes(95) == expected
+
+
+def test_set_iv_and_reset_stop_prefetching():
+    cipher = Rabbit(KEY, 7)
+    prefetch = cipher.enable_prefetch(64)
+    cipher.keystream_bytes(10)
+    cipher.set_iv(9)
+    assert cipher.prefetch is None and prefetch._thread is None
+    cipher.enable_prefetch(64)
+    cipher.reset(7)
+    assert cipher.prefetch is None
+    assert cipher.keystream_bytes(50) == Rabbit(KEY, 7).keystream_bytes(50)
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import SegmentedRabbit
+from Rabbit import Rabbit
+
+# segmented container: round trips, serial and parallel, and random access
+
+KEY = 0x0123456789abcdef0123456789abcdef
+SEGMENT_SIZE = 1000
+DATA = os.urandom(5 * SEGMENT_SIZE + 123)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_round_trip(workers):
+    container = SegmentedRabbit.encrypt_segments(KEY, DATA, iv = 5, segment_size = SEGMENT_SIZE, workers = workers)
+    segment_size, total, iv, index = SegmentedRabbit.read_header(container)
+    assert (segment_size, total, iv, len(index)) == (SEGMENT_SIZE, len(DATA), 5, 6)
+    assert index[-1][1] == 123
+    assert SegmentedRabbit.decrypt_segments(KEY, container, workers = workers) == DATA
+
+
+def test_serial_and_parallel_agree():
+    serial = SegmentedRabbit.encrypt_segments(KEY, DATA, segment_size = SEGMENT_SIZE, workers = 1)
+    parallel = SegmentedRabbit.encrypt_segments(KEY, DATA, segment_size = SEGMENT_SIZE, workers = 2)
+    assert serial == parallel
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_file_round_trip(tmp_path, workers):
+    source = tmp_path / 'plain.bin'
+    source.write_bytes(DATA)
+    encrypted = str(tmp_path / 'plain.rseg')
+    output = str(tmp_path / 'out.bin')
+    assert SegmentedRabbit.encrypt_file(KEY, str(source), encrypted, iv = 9,
+                                        segment_size = SEGMENT_SIZE, workers = workers) == len(DATA)
+    with open(encrypted, 'rb') as file:
+        assert file.read() == SegmentedRabbit.encrypt_segments(KEY, DATA, iv = 9, segment_size = SEGMENT_SIZE, workers = 1)
+    assert SegmentedRabbit.decrypt_file(KEY, encrypted, output, workers = workers) == len(DATA)
+    with open(output, 'rb') as file:
+        assert file.read() == DATA
+
+
+def test_random_access():
+    container = SegmentedRabbit.encrypt_segments(KEY, DATA, iv = 3, segment_size = SEGMENT_SIZE, workers = 1)
+    for number in range(6):
+        start = number * SEGMENT_SIZE
+        assert SegmentedRabbit.decrypt_segment(KEY, container, number) == DATA[start:start + SEGMENT_SIZE]
+    # every segment is a plain Rabbit stream with its own IV
+    offset, length = SegmentedRabbit.read_header(container)[3][1]
+    expected = Rabbit(KEY, SegmentedRabbit.segment_iv(3, 1)).encrypt_bytes(DATA[SEGMENT_SIZE:2 * SEGMENT_SIZE])
+    assert container[offset:offset + length] == expected
+
+
+@pytest.mark.parametrize('number', [-1, -6, 6, 100])
+def test_segment_number_out_of_range(number):
+    container = SegmentedRabbit.encrypt_segments(KEY, DATA, segment_size = SEGMENT_SIZE, workers = 1)
+    with pytest.raises(ValueError):
+        SegmentedRabbit.decrypt_segment(KEY, container, number)
+
+
+def test_empty_data():
+    container = SegmentedRabbit.encrypt_segments(KEY, b'', workers = 1)
+    assert SegmentedRabbit.decrypt_segments(KEY, container, workers = 1) == b''
+
+
+@pytest.mark.parametrize('bad', [b'', b'RSEG', b'XXXX' + bytes(25)])
+def test_invalid_header(bad):
+    with pytest.raises(ValueError):
+        SegmentedRabbit.read_header(bad)
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import os
+import socket
+
+import pytest
+
+from MHKS import MerkleHellmanKnapsack
+from NewECDSA import ECDSA, EllipticCurve
+from TransferService import TransferReceiver, send_file
+
+# transfers against a receiver on localhost: only a verified file from a
+# trusted sender is left in output_dir
+
+
+@pytest.fixture(scope='module')
+def parties():
+    bob = MerkleHellmanKnapsack()
+    curve = EllipticCurve()
+    ecdsa = ECDSA(curve)
+    private_key, public_key = ecdsa.generate_key_pair()
+    return bob, curve, ecdsa, private_key, public_key
+
+
+def _source(tmp_path):
+    src = tmp_path / 'in.bin'
+    src.write_bytes(os.urandom(10000))
+    out = tmp_path / 'out'
+    out.mkdir()
+    return str(src), str(out)
+
+
+async def _serve_tcp(receiver, send):
+    server = await receiver.start_tcp()
+    try:
+        return await send(server.sockets[0].getsockname()[1])
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_tcp_round_trip(tmp_path, parties):
+    bob, curve, ecdsa, private_key, public_key = parties
+    src, out = _source(tmp_path)
+    receiver = TransferReceiver(bob, out, [public_key], curve)
+
+    stats = asyncio.run(_serve_tcp(receiver, lambda port: send_file(
+        src, bob.public_key, ecdsa, private_key, public_key, port = port, chunk_size = 4096)))
+    assert stats['verified'] and stats['bytes'] == 10000 and stats['chunks'] == 3
+    assert os.listdir(out) == ['transfer-1.bin']
+    with open(src, 'rb') as a, open(os.path.join(out, 'transfer-1.bin'), 'rb') as b:
+        assert a.read() == b.read()
+    assert receiver.stats()['transfers'][0]['verified']
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason = "no Unix sockets")
+def test_unix_round_trip(tmp_path, parties):
+    bob, curve, ecdsa, private_key, public_key = parties
+    src, out = _source(tmp_path)
+    receiver = TransferReceiver(bob, out, [public_key], curve)
+    sock = str(tmp_path / 'rx.sock')
+
+    async def run():
+        server = await receiver.start_unix(sock)
+        try:
+            return await send_file(src, bob.public_key, ecdsa, private_key, public_key, unix_path = sock)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(run())['verified']
+    assert os.listdir(out) == ['transfer-1.bin']
+
+
+def test_untrusted_sender(tmp_path, parties):
+    bob, curve, ecdsa, private_key, public_key = parties
+    src, out = _source(tmp_path)
+    receiver = TransferReceiver(bob, out, [public_key], curve)
+    other_private, other_public = ecdsa.generate_key_pair()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(_serve_tcp(receiver, lambda port: send_file(
+            src, bob.public_key, ecdsa, other_private, other_public, port = port)))
+    transfer = receiver.stats()['transfers'][0]
+    assert not transfer['verified'] and 'unknown sender' in transfer['error']
+    assert os.listdir(out) == []
+
+
+def test_tampered_signature(tmp_path, parties, monkeypatch):
+    bob, curve, ecdsa, private_key, public_key = parties
+    src, out = _source(tmp_path)
+    receiver = TransferReceiver(bob, out, [public_key], curve)
+    # the sender signs some other digest than the one of the data it sent
+    sign_digest = ecdsa.sign_digest
+    monkeypatch.setattr(ecdsa, 'sign_digest',
+                        lambda key, digest: sign_digest(key, hashlib.sha256(digest).digest()))
+
+    stats = asyncio.run(_serve_tcp(receiver, lambda port: send_file(
+        src, bob.public_key, ecdsa, private_key, public_key, port = port, chunk_size = 4096)))
+    assert not stats['verified']
+    transfer = receiver.stats()['transfers'][0]
+    assert not transfer['verified'] and transfer['bytes'] == 10000 and transfer['error'] is None
+    assert os.listdir(out) == []
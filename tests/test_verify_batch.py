@@ -0,0 +1,53 @@
+import random
+
+from NewECDSA import ECDSA, EllipticCurve
+
+# verify_batch gives the same answers as verify, in process and with workers
+
+curve = EllipticCurve()
+n = curve.order
+rng = random.Random(7)
+
+
+def signed_items(ecdsa, keys = 3, count = 4):
+    items = []
+    for i in range(keys):
+        private_key, public_key = ecdsa.generate_key_pair()
+        for j in range(count):
+            message = 'message %d %d' % (i, j)
+            signature = ecdsa.sign(private_key, message)
+            items.append((public_key, message, signature))
+            r, s = signature
+            # tampered message, out of range signatures (s + n is the same s mod n)
+            items.append((public_key, message + '!', signature))
+            items.append((public_key, message, (r, s + n)))
+            items.append((public_key, message, (r + n, s)))
+            items.append((public_key, message, (0, s)))
+            items.append((public_key, message, (r, 0)))
+    return items
+
+
+def test_verify_batch_matches_verify():
+    ecdsa = ECDSA(curve)
+    items = signed_items(ecdsa)
+    expected = [ecdsa.verify(*item) for item in items]
+    assert expected.count(True) == 12
+    assert ecdsa.verify_batch(items) == expected
+
+
+def test_pool_is_kept_between_calls():
+    ecdsa = ECDSA(curve)
+    items = signed_items(ecdsa, keys = 2, count = 2)
+    expected = [ecdsa.verify(*item) for item in items]
+    try:
+        assert ecdsa.verify_batch(items, workers = 2) == expected
+        pool = ecdsa._batch_pool
+        assert ecdsa.verify_batch(items, workers = 2) == expected
+        assert ecdsa._batch_pool is pool
+        workers = ecdsa.table_cache_stats()['workers']
+        assert workers
+        assert sum(stats['hits'] for stats in workers.values()) > 0
+    finally:
+        ecdsa.close_batch_pool()
+    assert ecdsa._batch_pool is None
+    assert ecdsa.table_cache_stats()['workers'] == {}
@@ -0,0 +1,139 @@
+import mmap
+import os
+import random
+
+import pytest
+
+import WireFormat
+from NewECDSA import EllipticCurve
+
+# envelope encoding and parsing, the parser gets untrusted input
+
+curve = EllipticCurve()
+rng = random.Random(16)
+PUBLIC_KEY = curve.multiply_generator(rng.randrange(1, curve.order))
+SIGNATURE = (rng.randrange(1, curve.order), rng.randrange(1, curve.order))
+WRAPPED_KEY = rng.getrandbits(300)
+PAYLOAD = os.urandom(1000)
+RECIPIENT_KEYS = [[rng.getrandbits(200) for i in range(4)] for j in range(3)]
+WRAPPED_KEYS = [rng.getrandbits(250) for key in RECIPIENT_KEYS]
+
+
+def single():
+    return WireFormat.encode_envelope(WRAPPED_KEY, SIGNATURE, PUBLIC_KEY, PAYLOAD)
+
+
+def multi():
+    recipients = [(WireFormat.key_fingerprint(key), wrapped) for key, wrapped in zip(RECIPIENT_KEYS, WRAPPED_KEYS)]
+    return WireFormat.encode_multi_header(recipients, SIGNATURE, PUBLIC_KEY, len(PAYLOAD)) + PAYLOAD
+
+
+def check_single(envelope):
+    assert envelope.wrapped_key_int() == WRAPPED_KEY
+    assert envelope.signature() == SIGNATURE
+    assert envelope.public_key_point(curve) == PUBLIC_KEY
+    assert envelope.payload == PAYLOAD
+
+
+def check_multi(envelope):
+    for key, wrapped in zip(RECIPIENT_KEYS, WRAPPED_KEYS):
+        assert envelope.wrapped_key_for(key) == wrapped
+    with pytest.raises(KeyError):
+        envelope.wrapped_key_for([1, 2, 3])
+    assert envelope.signature() == SIGNATURE
+    assert envelope.public_key_point(curve) == PUBLIC_KEY
+    assert envelope.payload == PAYLOAD
+
+
+CASES = [(single, WireFormat.parse_envelope, check_single),
+         (multi, WireFormat.parse_multi_envelope, check_multi)]
+
+
+@pytest.mark.parametrize('encode, parse, check', CASES, ids = ['single', 'multi'])
+def test_round_trip_bytes(encode, parse, check):
+    data = encode()
+    check(parse(data))
+    check(parse(bytearray(data)))
+
+
+@pytest.mark.parametrize('encode, parse, check', CASES, ids = ['single', 'multi'])
+def test_round_trip_mmap(tmp_path, encode, parse, check):
+    path = tmp_path / 'envelope'
+    path.write_bytes(encode())
+    with open(str(path), 'rb') as file, \
+         mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+        envelope = parse(data)
+        try:
+            check(envelope)
+        finally:
+            envelope.release()
+
+
+def test_signature_offset():
+    data = single()
+    offset = WireFormat.signature_offset(WRAPPED_KEY)
+    assert data[offset:offset + WireFormat.COORD_BYTES] == SIGNATURE[0].to_bytes(WireFormat.COORD_BYTES, 'big')
+
+
+@pytest.mark.parametrize('encode, parse, check', CASES, ids = ['single', 'multi'])
+def test_every_truncation_fails(encode, parse, check):
+    data = encode()
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            parse(data[:size])
+
+
+@pytest.mark.parametrize('encode, parse, check', CASES, ids = ['single', 'multi'])
+def test_mmap_closes_after_failed_parse(tmp_path, encode, parse, check):
+    path = tmp_path / 'envelope'
+    data = encode()
+    for size in (0, 3, 10, len(data) // 2, len(data) - 1):
+        path.write_bytes(data[:size] or b'\0')
+        # the error goes through the with block: closing the mmap must
+        # not fail with BufferError and hide it
+        with pytest.raises(ValueError):
+            with open(str(path), 'rb') as file, \
+                 mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+                parse(mapped)
+
+
+@pytest.mark.parametrize('parse', [WireFormat.parse_envelope, WireFormat.parse_multi_envelope])
+def test_bad_magic_and_version(parse):
+    data = single() if parse is WireFormat.parse_envelope else multi()
+    with pytest.raises(ValueError):
+        parse(b'NOPE' + data[4:])
+    bad_version = bytearray(data)
+    bad_version[4] = WireFormat.VERSION + 1
+    with pytest.raises(ValueError):
+        parse(bad_version)
+
+
+def test_compress_both_parities():
+    parities = set()
+    for i in range(1, 40):
+        P = curve.multiply_generator(i)
+        data = WireFormat.compress_point(P)
+        assert len(data) == WireFormat.POINT_BYTES
+        assert data[0] == 2 + (P[1] & 1)
+        assert WireFormat.decompress_point(data, curve) == P
+        parities.add(P[1] & 1)
+    assert parities == {0, 1}
+
+
+def test_decompress_invalid():
+    x = 1
+    while True:
+        # find an x with no point on the curve
+        rhs = (x ** 3 + curve.a * x + curve.b) % curve.p
+        if pow(rhs, (curve.p - 1) // 2, curve.p) != 1:
+            break
+        x += 1
+    with pytest.raises(ValueError):
+        WireFormat.decompress_point(b'\x02' + x.to_bytes(WireFormat.COORD_BYTES, 'big'), curve)
+    with pytest.raises(ValueError):
+        WireFormat.decompress_point(b'\x02' + curve.p.to_bytes(WireFormat.COORD_BYTES, 'big'), curve)
+    good = WireFormat.compress_point(PUBLIC_KEY)
+    with pytest.raises(ValueError):
+        WireFormat.decompress_point(b'\x04' + good[1:], curve)
+    with pytest.raises(ValueError):
+        WireFormat.decompress_point(good[:-1], curve)